@@ -154,3 +154,65 @@ SPECTACULAR_SETTINGS = {
 }
 
 SIMPLE_HISTORY_HISTORY_CHANGE_REASON_USE_TEXT_FIELD = True
+
+# Default number of .cat file lines parsed and saved at a time by line
+# uploads that don't set chunk_size. None reads the whole file at once.
+LINE_UPLOAD_CHUNK_SIZE = None
+
+# Number of lines fetched at a time from the database by streamed
+# line queries.
+LINE_QUERY_STREAM_CHUNK_SIZE = 2000
+
+# Number of lines fetched at a time from the database by line exports.
+LINE_EXPORT_CHUNK_SIZE = 100000
+
+# Maximum number of frequency windows of a batch line query.
+LINE_QUERY_MAX_WINDOWS = 10000
+
+# Lifetime in seconds of species depictions requested with their
+# current depiction key, which changes with the molecule.
+DEPICTION_MAX_AGE = 365 * 24 * 60 * 60
+
+# Maximum number of species of a similarity search.
+SPECIES_SIMILAR_MAX_TOP_K = 1000
+
+# Maximum number of species of a bulk species creation.
+SPECIES_BULK_MAX_ROWS = 10000
+
+# Worker processes computing the fields of bulk created species from
+# their SMILES (None for one per CPU), used from this many species up;
+# fewer are computed in the request process.
+SPECIES_BULK_WORKERS = None
+SPECIES_BULK_PARALLEL_MIN_ROWS = 200
+
+# Number of entries of each cache of molecules and fields derived from
+# SMILES strings.
+CHEM_CACHE_SIZE = 1024
+
+# Number of compiled species metadata partition functions kept in
+# memory for line uploads.
+PARTITION_FUNCTION_CACHE_SIZE = 128
+
+# Cache of the responses of read-only data API requests. The cache
+# alias can point at any Django cache backend; entries are invalidated
+# when the models they were read from change.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+DATA_RESPONSE_CACHE_ALIAS = 'default'
+
+DATA_RESPONSE_CACHE_TIMEOUT = 3600
+
+# Seconds the model versions keying cached responses are kept. A write
+# drops them at once from the cache it runs against, but workers with a
+# cache of their own, such as the default local-memory one, only see it
+# when their copy expires.
+DATA_RESPONSE_VERSION_TIMEOUT = 5
+
+# Responses larger than this many bytes are not cached, so that large
+# line queries do not fill the memory of every worker. They still get
+# an ETag to revalidate against.
+DATA_RESPONSE_CACHE_MAX_BYTES = 1024 * 1024
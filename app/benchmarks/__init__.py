@@ -0,0 +1,6 @@
+"""
+Standalone performance benchmarks.
+
+Run them from the app directory, e.g.
+``python -m benchmarks.read_spcat --lines 1000000``.
+"""
@@ -0,0 +1,62 @@
+"""
+Compares exporting the lines of a species metadata as the JSON of line
+queries with the columnar binary exports. Needs the configured
+database; everything it writes is rolled back.
+"""
+import argparse
+import functools
+import io
+import time
+
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+# Importing benchmarks.line_insert sets up Django.
+from benchmarks.line_insert import create_meta
+from benchmarks.synthetic import synthetic_cat, synthetic_qpart
+from data import export, ingest
+from data.parse_line import parse_cat
+from data.serializers import QueryValuesSerializer
+from core.models import Line
+
+
+def _export_json(meta_id, output):
+    queryset = QueryValuesSerializer.project(
+        Line.objects.filter(meta_id=meta_id).order_by('id'))
+    output.write(JSONEncoder().encode(
+        QueryValuesSerializer(queryset, many=True).data).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1000000)
+    args = parser.parse_args()
+
+    parsed_cat = parse_cat(io.BytesIO(synthetic_cat(args.lines)),
+                           ['J', 'Ka', 'Kc'],
+                           qpart_file=io.StringIO(synthetic_qpart()),
+                           qn_json=True)
+    with transaction.atomic():
+        meta = create_meta()
+        n_lines = ingest.copy_lines(parsed_cat, meta.id, False, False, '',
+                                    'benchmark')
+        print(f'{n_lines} lines')
+        exports = [('json', functools.partial(_export_json, meta.id))]
+        for file_format in export.FORMATS:
+            if file_format == 'npz' or export.pyarrow is not None:
+                exports.append((file_format, functools.partial(
+                    export.export_lines, [meta.id],
+                    file_format=file_format)))
+        for name, export_to in exports:
+            output = io.BytesIO()
+            start = time.perf_counter()
+            export_to(output)
+            elapsed = time.perf_counter() - start
+            print(f'  {name:8s} {elapsed:8.3f} s '
+                  f'{elapsed / n_lines * 1e6:8.2f} us/row '
+                  f'{len(output.getvalue()) / 2**20:10.1f} MiB')
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares rows/s of saving parsed lines through LineSerializerList with
+the bulk_create and COPY fast paths. Needs the configured database; everything
+it writes is rolled back.
+"""
+import argparse
+import io
+import json
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
+
+from django.db import transaction  # noqa: E402
+
+from benchmarks.synthetic import synthetic_cat, synthetic_qpart  # noqa
+from core.models import Linelist, Species, SpeciesMetadata  # noqa: E402
+from data import ingest  # noqa: E402
+from data.parse_line import parse_cat  # noqa: E402
+from data.serializers import LineSerializerList  # noqa: E402
+from data.views import LineViewSet  # noqa: E402
+
+
+def create_meta():
+    '''Creates the species metadata the benchmark lines belong to.'''
+    species = Species.objects.create(
+        name=json.dumps(['benchmark']), iupac_name='benchmark',
+        name_formula='benchmark', name_html='benchmark',
+        molecular_mass=30.047, smiles='CC',
+        standard_inchi='benchmark', standard_inchi_key='benchmark',
+        selfies='[C][C]', mol_obj='CC', notes='benchmark')
+    linelist = Linelist.objects.create(linelist_name='benchmark')
+    return SpeciesMetadata.objects.create(
+        species=species, linelist=linelist, molecule_tag=1,
+        hyperfine=False, degree_of_freedom=3, category='asymmetric top',
+        partition_function=json.dumps({'300.000': '1700.0'}),
+        mu_a=0.5, mu_b=0, mu_c=0, a_const=0, b_const=0, c_const=0,
+        data_date='2020-01-01', data_contributor='benchmark',
+        int_file='benchmark', var_file='benchmark', fit_file='benchmark',
+        lin_file='benchmark', notes='benchmark')
+
+
+def _save_serializer(parsed_cat, meta_id):
+    serializer = LineSerializerList(
+        data=LineViewSet()._get_line_dicts(
+            parsed_cat, meta_id, False, False, '', 'benchmark'),
+        many=True)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+def _save_bulk(parsed_cat, meta_id):
+    assert ingest.is_finite(parsed_cat)
+    ingest.bulk_create_lines(parsed_cat, meta_id, False, False, '',
+                             'benchmark')
+
+
+def _save_copy(parsed_cat, meta_id):
+    assert ingest.is_finite(parsed_cat)
+    ingest.copy_lines(parsed_cat, meta_id, False, False, '', 'benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=100000)
+    args = parser.parse_args()
+
+    cat = synthetic_cat(args.lines)
+    parsed_cat = parse_cat(io.BytesIO(cat), ['J', 'Ka', 'Kc'],
+                           qpart_file=io.StringIO(synthetic_qpart()))
+    # COPY takes the quantum numbers as pre-encoded JSON.
+    parsed_cat_json = parse_cat(io.BytesIO(cat), ['J', 'Ka', 'Kc'],
+                                qpart_file=io.StringIO(synthetic_qpart()),
+                                qn_json=True)
+    n_lines = len(parsed_cat.frequency)
+    print(f'{n_lines} lines')
+    for name, save, parsed in [
+            ('serializer', _save_serializer, parsed_cat),
+            ('bulk_create', _save_bulk, parsed_cat),
+            ('copy', _save_copy, parsed_cat_json)]:
+        with transaction.atomic():
+            meta = create_meta()
+            start = time.perf_counter()
+            save(parsed, meta.id)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        print(f'  {name:12s} {elapsed:8.3f} s '
+              f'{n_lines / elapsed:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
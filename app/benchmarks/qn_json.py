@@ -0,0 +1,63 @@
+"""
+Compares parsing a catalog with parse_cat into quantum number
+dictionaries, as the serializer and bulk_create paths do, then encoding
+them one dictionary at a time, as the COPY writer used to, with
+parse_cat encoding them column by column with qn_json.
+"""
+import argparse
+import io
+import json
+import time
+
+from benchmarks.synthetic import synthetic_cat, synthetic_qpart
+from data.parse_line import parse_cat
+
+
+def _parse(cat, qn_json=False):
+    return parse_cat(io.BytesIO(cat), ['J', 'Ka', 'Kc'],
+                     qpart_file=io.StringIO(synthetic_qpart()),
+                     qn_json=qn_json)
+
+
+def _per_row(cat):
+    '''Parses into dictionaries and encodes them one by one.'''
+    parsed_cat = _parse(cat)
+    return ([json.dumps(qns) for qns in parsed_cat.lower_state_qn_dict_list],
+            [json.dumps(qns) for qns in parsed_cat.upper_state_qn_dict_list])
+
+
+def _columnar(cat):
+    parsed_cat = _parse(cat, qn_json=True)
+    return parsed_cat.lower_state_qn_json, parsed_cat.upper_state_qn_json
+
+
+def _time(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=500000)
+    args = parser.parse_args()
+
+    cat = synthetic_cat(args.lines)
+    dicts_time, parsed_cat = _time(_parse, cat)
+    per_row_time, expected = _time(_per_row, cat)
+    columnar_time, result = _time(_columnar, cat)
+    assert [column.tolist() for column in result] == list(expected)
+
+    n_lines = len(parsed_cat.frequency)
+    print(f'{n_lines} lines')
+    for name, elapsed in [('parse_cat, dicts', dicts_time),
+                          ('parse_cat, dicts + json.dumps', per_row_time),
+                          ('parse_cat, qn_json', columnar_time)]:
+        print(f'  {name:30s} {elapsed:8.3f} s '
+              f'{elapsed / n_lines * 1e6:6.2f} us/row')
+    print(f'  qn_json speedup over dicts + json.dumps: '
+          f'{per_row_time / columnar_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
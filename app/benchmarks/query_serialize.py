@@ -0,0 +1,63 @@
+"""
+Compares the per-row cost of serializing line query results with
+QuerySerializer over model instances and with QueryValuesSerializer
+over values_list() rows. Needs the configured database; everything it
+writes is rolled back.
+"""
+import argparse
+import io
+import time
+
+from django.db import transaction
+
+# Importing benchmarks.line_insert sets up Django.
+from benchmarks.line_insert import create_meta
+from benchmarks.synthetic import synthetic_cat, synthetic_qpart
+from data import ingest
+from data.parse_line import parse_cat
+from data.serializers import QuerySerializer, QueryValuesSerializer
+from core.models import Line
+
+
+def _serialize_models(meta_id):
+    queryset = Line.objects.filter(meta_id=meta_id).order_by(
+        'frequency', 'id').select_related(
+            'meta', 'meta__species', 'meta__linelist')
+    return QuerySerializer(queryset, many=True).data
+
+
+def _serialize_values(meta_id):
+    queryset = QueryValuesSerializer.project(
+        Line.objects.filter(meta_id=meta_id).order_by('frequency', 'id'))
+    return QueryValuesSerializer(queryset, many=True).data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=100000)
+    args = parser.parse_args()
+
+    parsed_cat = parse_cat(io.BytesIO(synthetic_cat(args.lines)),
+                           ['J', 'Ka', 'Kc'],
+                           qpart_file=io.StringIO(synthetic_qpart()),
+                           qn_json=True)
+    with transaction.atomic():
+        meta = create_meta()
+        n_lines = ingest.copy_lines(parsed_cat, meta.id, False, False, '',
+                                    'benchmark')
+        print(f'{n_lines} lines')
+        results = []
+        for name, serialize in [('QuerySerializer', _serialize_models),
+                                ('QueryValuesSerializer',
+                                 _serialize_values)]:
+            start = time.perf_counter()
+            results.append(serialize(meta.id))
+            elapsed = time.perf_counter() - start
+            print(f'  {name:22s} {elapsed:8.3f} s '
+                  f'{elapsed / n_lines * 1e6:8.2f} us/row')
+        assert [dict(row) for row in results[0]] == results[1]
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
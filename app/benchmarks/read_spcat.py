@@ -0,0 +1,88 @@
+"""
+Compares the columnar SPCAT reader with the per-line slicing loop
+it replaced.
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_cat
+from data.parse_line import (_read_spcat, _read_spcat_records,
+                             _fix_spcat, kcm)
+
+
+_BOUNDS = [0, 13, 21, 29, 31, 41, 44, 51, 55, 57, 59, 61, 63, 65, 67,
+           69, 71, 73, 75, 77, None]
+
+
+def _split_loop(filein):
+    '''The previous field split: slice every line into per-field lists.'''
+    columns = [[] for _ in range(20)]
+    for x in filein.read().decode().splitlines():
+        if '*' in x:
+            continue
+        for column, start, end in zip(columns, _BOUNDS, _BOUNDS[1:]):
+            column.append(x[start:end].strip())
+    return columns
+
+
+def _read_spcat_loop(filein):
+    '''The previous reader built on the per-line split.'''
+    columns = _split_loop(filein)
+    frequency, freq_err, logint, dof, elow, gup, tag, qnformat = \
+        columns[:8]
+    split_cat = {
+        'frequency': np.array(frequency).astype(np.float64),
+        'freq_err': np.array(freq_err).astype(np.float64),
+        'logint': np.array(logint).astype(np.float64),
+        'dof': np.array(dof).astype(np.int64),
+        'elow': np.array(elow).astype(np.float64) / kcm,
+        'gup': np.array([_fix_spcat(x) for x in gup]).astype(int),
+        'tag': np.array(tag).astype(np.int64),
+        'qnformat': np.array(qnformat).astype(np.int64),
+    }
+    for i, column in enumerate(columns[8:], start=1):
+        split_cat[f'qn{i}'] = np.array([_fix_spcat(x) for x in column])
+    return split_cat
+
+
+def _time(func, data):
+    start = time.perf_counter()
+    result = func(io.BytesIO(data))
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1000000)
+    args = parser.parse_args()
+
+    data = synthetic_cat(args.lines, max_j=150)
+    split_loop_time, _ = _time(_split_loop, data)
+    split_columnar_time, _ = _time(_read_spcat_records, data)
+    loop_time, expected = _time(_read_spcat_loop, data)
+    columnar_time, result = _time(_read_spcat, data)
+
+    for key in ['frequency', 'freq_err', 'logint', 'dof', 'elow', 'gup',
+                'tag', 'qnformat']:
+        np.testing.assert_array_equal(result[key], expected[key])
+    for i, key in enumerate(['qn1up', 'qn2up', 'qn3up', 'qn4up', 'qn5up',
+                             'qn6up', 'qn1low', 'qn2low', 'qn3low',
+                             'qn4low', 'qn5low', 'qn6low'], start=1):
+        np.testing.assert_array_equal(result[key], expected[f'qn{i}'])
+
+    print(f'{len(expected["frequency"])} lines')
+    print('field split')
+    print(f'  per-line loop: {split_loop_time:8.3f} s')
+    print(f'  columnar:      {split_columnar_time:8.3f} s '
+          f'({split_loop_time / split_columnar_time:.1f}x)')
+    print('full reader')
+    print(f'  per-line loop: {loop_time:8.3f} s')
+    print(f'  columnar:      {columnar_time:8.3f} s '
+          f'({loop_time / columnar_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
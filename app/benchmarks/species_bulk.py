@@ -0,0 +1,34 @@
+"""
+Compares species/s of computing the fields of bulk created species from
+their SMILES in the request process with the pool of worker processes.
+"""
+import argparse
+import time
+
+from rdkit import RDLogger
+
+# Importing benchmarks.line_insert sets up Django.
+import benchmarks.line_insert  # noqa: F401
+from benchmarks.synthetic import synthetic_smiles
+from data import ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--species', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    RDLogger.DisableLog('rdApp.*')
+    smiles_list = synthetic_smiles(args.species)
+    print(f'{len(smiles_list)} species')
+    for name, workers in [('serial', 1), ('pool', args.workers)]:
+        start = time.perf_counter()
+        ingest.compute_species_fields(smiles_list, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f'  {name:8s} {elapsed:8.3f} s '
+              f'{len(smiles_list) / elapsed:10.0f} species/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares substructure searches of species running the exact match of
+the RDKit cartridge on its own with searches first screened by the
+stored pattern fingerprints. Needs the configured database; everything
+it writes is rolled back.
+"""
+import argparse
+import json
+import time
+
+from django.db import connection, transaction
+from django_rdkit.models import QMOL, Value
+from rdkit import RDLogger
+
+# Importing benchmarks.line_insert sets up Django.
+import benchmarks.line_insert  # noqa: F401
+from benchmarks.synthetic import synthetic_smiles
+from core.models import Species
+from data import chem
+from data.views import SpeciesViewSet
+
+QUERIES = ['c1ccccc1', 'c1ccncc1', 'C(=O)S', '[OX2H]', 'C#N', 'ClC=C',
+           'C1CCCC1C(=O)']
+
+
+def _create_species(smiles_list):
+    species = []
+    for i, smiles in enumerate(smiles_list):
+        mol = chem.to_mol(smiles)
+        species.append(Species(
+            name=json.dumps(['benchmark']), iupac_name=f'benchmark {i}',
+            name_formula='benchmark', name_html='benchmark',
+            molecular_mass=0, smiles=smiles, standard_inchi='benchmark',
+            standard_inchi_key='benchmark', selfies='benchmark',
+            mol_obj=smiles, notes='benchmark', **chem.fingerprints(mol)))
+    Species.objects.bulk_create(species, batch_size=5000)
+
+
+def _exact(query):
+    return Species.objects.filter(
+        mol_obj__hassubstruct=QMOL(Value(query)))
+
+
+def _screened(query):
+    return SpeciesViewSet()._screen_substruct(
+        Species.objects.all(), query).filter(
+            mol_obj__hassubstruct=QMOL(Value(query)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--species', type=int, default=100000)
+    args = parser.parse_args()
+
+    RDLogger.DisableLog('rdApp.*')
+    smiles_list = synthetic_smiles(args.species)
+    with transaction.atomic():
+        _create_species(smiles_list)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Species._meta.db_table}')
+        print(f'{len(smiles_list)} species')
+        for query in QUERIES:
+            results = []
+            timings = []
+            for search in [_exact, _screened]:
+                start = time.perf_counter()
+                results.append(sorted(
+                    search(query).values_list('id', flat=True)))
+                timings.append(time.perf_counter() - start)
+            assert results[0] == results[1]
+            print(f'  {query:14s} {len(results[0]):7d} hits '
+                  f'exact {timings[0]:8.3f} s '
+                  f'screened {timings[1]:8.3f} s '
+                  f'({timings[0] / timings[1]:.1f}x)')
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Synthetic SPCAT catalogs for benchmarking the .cat ingestion path, and
+synthetic species for benchmarking species searches.
+"""
+import numpy as np
+from rdkit import Chem
+
+
+def _encode_qn(value):
+    '''Encodes an integer quantum number into the 2-character
+    SPCAT field, using letters for values outside -9..99.'''
+    if value >= 100:
+        return chr(ord('A') + (value - 100) // 10) + str(value % 10)
+    if value <= -10:
+        return chr(ord('a') + (-value - 10) // 10) + str(-value % 10)
+    return f'{value:2d}'
+
+
+def synthetic_cat(n_lines, max_j=99, overflow_every=1000, seed=0):
+    '''
+    Returns the bytes of an asymmetric top .cat file with n_lines
+    transitions (J, Ka, Kc quantum numbers, J < max_j; values from 100
+    on use SPCAT letter codes). Every overflow_every-th
+    line is written with '*' intensity overflow, like SPCAT does for
+    catalogs simulated too high.
+    '''
+    rng = np.random.default_rng(seed)
+    j_low = rng.integers(0, max_j, n_lines)
+    ka_low = rng.integers(0, 20, n_lines) % (j_low + 1)
+    kc_low = j_low - ka_low
+    frequency = np.sort(rng.uniform(1e3, 1e6, n_lines))
+    freq_err = rng.uniform(0, 1, n_lines)
+    logint = rng.uniform(-12, -2, n_lines)
+    elow = rng.uniform(0, 5000, n_lines)
+    gup = 2 * j_low + 3
+
+    lines = []
+    for i in range(n_lines):
+        if overflow_every and i % overflow_every == overflow_every - 1:
+            intensity = '********'
+        else:
+            intensity = f'{logint[i]:8.4f}'
+        qn_up = ''.join(_encode_qn(x) for x in (
+            j_low[i] + 1, ka_low[i], kc_low[i] + 1))
+        qn_low = ''.join(_encode_qn(x) for x in (
+            j_low[i], ka_low[i], kc_low[i]))
+        lines.append(f'{frequency[i]:13.4f}{freq_err[i]:8.4f}{intensity}'
+                     f' 3{elow[i]:10.4f}{gup[i]:3d} 123456 303'
+                     f'{qn_up}      {qn_low}')
+    return '\n'.join(lines).encode()
+
+
+def synthetic_qpart():
+    '''Returns the text of an interpolation .qpart file to go with
+    synthetic_cat.'''
+    return ('#form : interpolation\n'
+            '9.375 10.0\n18.75 30.0\n37.5 80.0\n75.0 200.0\n'
+            '150.0 600.0\n225.0 1100.0\n300.0 1700.0\n500.0 3500.0\n')
+
+
+SMILES_FRAGMENTS = ['C', 'CC', 'C(C)', 'C(=O)', 'C=C', 'O', 'N', 'S',
+                    'F', 'Cl', 'c1ccccc1', 'c1ccncc1', 'C1CCCC1', 'C#N']
+
+
+def synthetic_smiles(n_species, max_fragments=8, seed=0):
+    '''
+    Returns n_species distinct canonical SMILES of random chains of
+    SMILES_FRAGMENTS, keeping the chains RDKit can parse.
+    '''
+    rng = np.random.default_rng(seed)
+    smiles = {}
+    while len(smiles) < n_species:
+        fragments = rng.choice(SMILES_FRAGMENTS,
+                               rng.integers(1, max_fragments + 1))
+        mol = Chem.MolFromSmiles(''.join(fragments))
+        if mol is not None:
+            smiles.setdefault(Chem.MolToSmiles(mol))
+    return list(smiles)
@@ -0,0 +1,60 @@
+"""
+Stored PNG depictions of species molecules.
+"""
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rdkit import Chem
+from rdkit.Chem import Draw
+
+DEPICTION_SIZE = 400
+
+
+def _to_mol(mol):
+    # Mol fields hold the SMILES they were assigned until reloaded.
+    return Chem.MolFromSmiles(mol) if isinstance(mol, str) else mol
+
+
+def smiles_key(canonical_smiles):
+    '''Returns the hash of a canonical SMILES, which keys the depiction
+    of its molecule, so species of the same molecule share one.'''
+    return hashlib.sha256(canonical_smiles.encode()).hexdigest()
+
+
+def depiction_key(mol):
+    '''Returns the depiction key of a molecule.'''
+    return smiles_key(Chem.MolToSmiles(_to_mol(mol)))
+
+
+def depiction_path(key):
+    return f'depictions/{key[:2]}/{key}.png'
+
+
+def render_png(mol):
+    '''Renders a molecule as a PNG image with RDKit.'''
+    dm = Draw.PrepareMolForDrawing(_to_mol(mol))
+    d2d = Draw.MolDraw2DCairo(DEPICTION_SIZE, DEPICTION_SIZE)
+    d2d.DrawMolecule(dm)
+    d2d.FinishDrawing()
+    return d2d.GetDrawingText()
+
+
+def save_depiction(mol, key=None):
+    '''
+    Renders the depiction of a molecule into the default storage unless
+    it is stored already. Returns its key, which is computed unless
+    given.
+    '''
+    key = key or depiction_key(mol)
+    path = depiction_path(key)
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(render_png(mol)))
+    return key
+
+
+def open_depiction(key, mol):
+    '''Returns the stored PNG depiction of key opened for reading,
+    rendering it from mol first if it is not stored.'''
+    return default_storage.open(depiction_path(save_depiction(mol, key)),
+                                'rb')
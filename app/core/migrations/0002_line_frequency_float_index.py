@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='line',
+            name='core_line_frequen_cc6179_idx',
+        ),
+        migrations.AddIndex(
+            model_name='line',
+            index=models.Index(
+                django.db.models.functions.comparison.Cast(
+                    'frequency', models.FloatField()),
+                models.F('id'), name='core_line_frequency_float_idx'),
+        ),
+    ]
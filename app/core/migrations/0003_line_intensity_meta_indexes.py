@@ -0,0 +1,38 @@
+from django.contrib.postgres.operations import (AddIndexConcurrently,
+                                                RemoveIndexConcurrently)
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    # The line table is large, so its indexes are built without locking
+    # out writes, which cannot run in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_line_frequency_float_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='line',
+            index=models.Index(
+                django.db.models.functions.comparison.Cast(
+                    'frequency', models.FloatField()),
+                models.F('id'), include=('intensity', 'meta'),
+                name='core_line_frequency_cover_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='line',
+            name='core_line_frequency_float_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='line',
+            index=models.Index(
+                models.F('meta'),
+                django.db.models.functions.comparison.Cast(
+                    'frequency', models.FloatField()),
+                models.F('id'), name='core_line_meta_frequency_idx'),
+        ),
+    ]
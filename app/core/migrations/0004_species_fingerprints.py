@@ -0,0 +1,75 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django_rdkit.models.fields
+from django.db import migrations, models
+
+from rdkit import Chem
+from rdkit.Chem import rdFingerprintGenerator
+
+
+def fill_fingerprints(apps, schema_editor):
+    """Compute the fingerprints of the existing species, as
+    data.chem.fingerprints did when this migration was written."""
+    Species = apps.get_model('core', 'Species')
+    morgan_generator = rdFingerprintGenerator.GetMorganGenerator(
+        radius=2, fpSize=2048)
+    for species in Species.objects.only('id', 'mol_obj').iterator():
+        mol = species.mol_obj
+        if isinstance(mol, str):
+            mol = Chem.MolFromSmiles(mol)
+        if mol is not None:
+            Species.objects.filter(id=species.id).update(
+                pattern_fp=list(Chem.PatternFingerprint(
+                    mol, fpSize=2048).GetOnBits()),
+                morgan_fp=morgan_generator.GetFingerprint(mol))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_line_intensity_meta_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='species',
+            name='pattern_fp',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), blank=True, null=True,
+                size=None),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='morgan_fp',
+            field=django_rdkit.models.fields.BfpField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicalspecies',
+            name='pattern_fp',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), blank=True, null=True,
+                size=None),
+        ),
+        migrations.AddField(
+            model_name='historicalspecies',
+            name='morgan_fp',
+            field=django_rdkit.models.fields.BfpField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='species',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['pattern_fp'], name='core_species_pattern_fp_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='species',
+            index=models.Index(
+                condition=models.Q(pattern_fp__isnull=True),
+                fields=['id'], name='core_species_no_pattern_fp'),
+        ),
+        migrations.AddIndex(
+            model_name='species',
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=['morgan_fp'], name='core_species_morgan_fp_gist'),
+        ),
+    ]
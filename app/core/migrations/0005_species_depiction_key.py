@@ -0,0 +1,41 @@
+import hashlib
+
+from django.db import migrations, models
+from rdkit import Chem
+
+
+def fill_depiction_keys(apps, schema_editor):
+    """Compute the depiction keys of the existing species, as
+    core.depiction.depiction_key did when this migration was written."""
+    Species = apps.get_model('core', 'Species')
+    for species in Species.objects.only('id', 'mol_obj').iterator():
+        mol = species.mol_obj
+        if isinstance(mol, str):
+            mol = Chem.MolFromSmiles(mol)
+        if mol is not None:
+            Species.objects.filter(id=species.id).update(
+                depiction_key=hashlib.sha256(
+                    Chem.MolToSmiles(mol).encode()).hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_species_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='species',
+            name='depiction_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalspecies',
+            name='depiction_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_depiction_keys, migrations.RunPython.noop),
+    ]
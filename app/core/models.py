@@ -9,14 +9,17 @@ from django.contrib.auth.models import (
     BaseUserManager,
     PermissionsMixin
 )
-from django.utils.functional import cached_property
 from django.utils.html import format_html
-from rdkit.Chem import Draw
-import base64
+from django.urls import reverse
 from django.core.validators import FileExtensionValidator
 from simple_history.models import HistoricalRecords
 from simple_history import register
-from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, RowNumber
+from core import depiction
 
 
 class ArbitraryDecimalField(models.DecimalField):
@@ -126,12 +129,34 @@ class Reference(models.Model):
         return self.ref_url
 
 
+class SpeciesQuerySet(models.QuerySet):
+    """QuerySet for species."""
+
+    def update(self, **kwargs):
+        """Update species, clearing the fingerprints of a new rdkit mol
+        object unless they are given. Saving a species computes them,
+        but an update cannot, and substructure searches match species
+        without a pattern fingerprint against their mol_obj."""
+        if 'mol_obj' in kwargs:
+            kwargs.setdefault('pattern_fp', None)
+            kwargs.setdefault('morgan_fp', None)
+        return super().update(**kwargs)
+
+
 class Species(models.Model):
     """Species object."""
     class Meta:
         verbose_name_plural = 'Species'
         indexes = [
             GistIndex(fields=['mol_obj']),
+            GinIndex(fields=['pattern_fp'],
+                     name='core_species_pattern_fp_gin'),
+            # Species without a pattern fingerprint pass the screen of
+            # substructure searches.
+            models.Index(fields=['id'], name='core_species_no_pattern_fp',
+                         condition=models.Q(pattern_fp__isnull=True)),
+            GistIndex(fields=['morgan_fp'],
+                      name='core_species_morgan_fp_gist'),
         ]
     name = models.JSONField()
     iupac_name = models.CharField(max_length=255, unique=True)
@@ -143,25 +168,45 @@ class Species(models.Model):
     standard_inchi_key = models.CharField(max_length=255)
     selfies = models.CharField(max_length=255)
     mol_obj = models.MolField()
+    # On bits of the RDKit pattern fingerprint of mol_obj, screening
+    # substructure searches.
+    pattern_fp = ArrayField(models.IntegerField(), null=True, blank=True)
+    morgan_fp = models.BfpField(null=True, blank=True)
+    # Key of the stored depiction of mol_obj, from core.depiction.
+    depiction_key = models.CharField(max_length=64, blank=True)
     notes = models.TextField(blank=True)
     history = HistoricalRecords()
 
+    objects = SpeciesQuerySet.as_manager()
+
     def __str__(self):
         return self.iupac_name
 
-    @cached_property
+    def save(self, *args, update_fields=None, **kwargs):
+        """Save a species. The fingerprints are computed from mol_obj
+        by a pre_save handler of the data app, so saving mol_obj saves
+        them too."""
+        if update_fields is not None and 'mol_obj' in update_fields:
+            update_fields = {*update_fields, 'pattern_fp', 'morgan_fp'}
+        return super().save(*args, update_fields=update_fields, **kwargs)
+
+    @property
+    def image_url(self):
+        """URL of the depiction of the species, versioned by its key so
+        that it can be cached for good."""
+        if not self.depiction_key:
+            return None
+        url = reverse('data:species-image', args=[self.id])
+        return f'{url}?v={self.depiction_key}'
+
     def display_mol(self):
         """function for displaying the rdkit mol object in the
         form of image in django admin."""
-        if self.mol_obj:
-            dm = Draw.PrepareMolForDrawing(self.mol_obj)
-            d2d = Draw.MolDraw2DCairo(400, 400)
-            d2d.DrawMolecule(dm)
-            d2d.FinishDrawing()
-            text = d2d.GetDrawingText()
-            imtext = base64.b64encode(text).decode('utf8')
-            html = '<img src="data:image/png;base64, {img}" alt="rdkit image">'
-            return format_html(html, img=imtext)
+        if self.image_url:
+            html = '<img src="{url}" width="{size}" height="{size}" ' \
+                'alt="rdkit image">'
+            return format_html(html, url=self.image_url,
+                               size=depiction.DEPICTION_SIZE)
         return format_html('<strong>There is no image for this entry.<strong>')
     display_mol.short_description = 'Display rdkit image'
 
@@ -242,6 +287,33 @@ class MetaReference(models.Model):
             return "metadata reference for "+self.meta.species.iupac_name
 
 
+class LineQuerySet(models.QuerySet):
+    """QuerySet for lines."""
+
+    def alias_frequency_float(self):
+        """Alias frequency_float, the double precision cast of frequency
+        covered by the frequency index. Range filters and ordering on it
+        compare float8 keys instead of numerics; frequency keeps the
+        exact value."""
+        return self.alias(
+            frequency_float=Cast('frequency', models.FloatField()))
+
+    def top_n_per_species(self, n):
+        """Keep the n most intense lines of every species among the
+        lines of this queryset. The lines are ranked with a ROW_NUMBER()
+        window over each species in the database, ties broken by id;
+        Django cannot filter on a window function, so the ranking is a
+        subquery."""
+        ranked = self.order_by().annotate(species_rank=Window(
+            RowNumber(), partition_by=[F('meta__species_id')],
+            order_by=[F('intensity').desc(), F('id').asc()])).values(
+                'id', 'species_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE species_rank <= %s',
+            (*params, n)))
+
+
 class Line(models.Model):
     """Line object."""
     meta = models.ForeignKey(
@@ -269,9 +341,17 @@ class Line(models.Model):
     notes = models.TextField(blank=True)
     history = HistoricalRecords()
 
+    objects = LineQuerySet.as_manager()
+
     class Meta:
         indexes = [
-            models.Index(fields=['frequency'])
+            # Covers the intensity threshold and the meta filters of
+            # frequency range queries.
+            models.Index(Cast('frequency', models.FloatField()), 'id',
+                         name='core_line_frequency_cover_idx',
+                         include=['intensity', 'meta']),
+            models.Index('meta', Cast('frequency', models.FloatField()),
+                         'id', name='core_line_meta_frequency_idx'),
         ]
 
     def __str__(self):
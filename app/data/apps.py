@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'data'
+
+    def ready(self):
+        from data import cache, chem
+        cache.connect_signals()
+        chem.connect_signals()
@@ -0,0 +1,199 @@
+"""
+Response cache for the read-only endpoints of data APIs.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from core.models import (Linelist, Reference, Species, SpeciesMetadata,
+                         MetaReference, Line)
+
+# Models whose changes invalidate cached responses.
+CACHED_MODELS = [Linelist, Reference, Species, SpeciesMetadata,
+                 MetaReference, Line]
+
+
+def _cache():
+    return caches[settings.DATA_RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(model, meta_id=None):
+    if meta_id is None:
+        return f'data:version:{model._meta.label_lower}'
+    return f'data:version:{model._meta.label_lower}:{meta_id}'
+
+
+def _read_version(model, meta_id=None):
+    '''Reads the version of a model, or of the lines of a species
+    metadata, from its history table.'''
+    history = model.history.all()
+    if meta_id is not None:
+        history = history.filter(meta_id=meta_id)
+    latest = history.order_by('-history_id').values_list(
+        'history_id', 'history_date').first()
+    if latest is None:
+        return 0, None
+    history_id, history_date = latest
+    if meta_id is not None:
+        # A line moved to another species metadata adds a history row
+        # of that one only, but leaves this one with fewer lines, and
+        # the move is no later than the latest change of any line.
+        history_id = (history_id,
+                      Line.objects.filter(meta_id=meta_id).count())
+        history_date = model.history.order_by('-history_id').values_list(
+            'history_date', flat=True)[0]
+    return history_id, int(history_date.timestamp())
+
+
+def get_versions(models, meta_ids=None):
+    '''
+    Returns the versions of models as (history_id, timestamp) pairs: the
+    id and time of their latest history row, which every save and delete
+    adds and ids never repeat, so versions only grow. For Line, meta_ids
+    gives the versions of the lines of those species metadata instead,
+    which also count their lines.
+    Versions are read from the cache, and from the history tables when
+    they are not cached. Writes only drop the cached versions of the
+    cache they run against, so cached versions also expire after
+    DATA_RESPONSE_VERSION_TIMEOUT seconds, for the workers that do not
+    share it.
+    '''
+    keys = {}
+    for model in models:
+        if model is Line and meta_ids:
+            for meta_id in sorted(set(meta_ids)):
+                keys[_version_key(model, meta_id)] = (model, meta_id)
+        else:
+            keys[_version_key(model)] = (model, None)
+    versions = _cache().get_many(keys)
+    for key, (model, meta_id) in keys.items():
+        if key not in versions:
+            versions[key] = _read_version(model, meta_id)
+            _cache().set(key, versions[key],
+                         timeout=settings.DATA_RESPONSE_VERSION_TIMEOUT)
+    return [versions[key] for key in keys]
+
+
+def _forget_versions(model, meta_id=None):
+    keys = [_version_key(model)]
+    if meta_id is not None:
+        keys.append(_version_key(model, meta_id))
+    _cache().delete_many(keys)
+
+
+def invalidate(model, meta_id=None):
+    '''
+    Invalidates the cached responses that depend on a model, and for
+    Line on the lines of the species metadata meta_id, by dropping its
+    cached versions so that they are read again from the history table.
+    They are dropped again when the current transaction commits, so
+    that versions read while it was open do not outlive it.
+    '''
+    _forget_versions(model, meta_id)
+    transaction.on_commit(lambda: _forget_versions(model, meta_id))
+
+
+def _remember_line_meta(sender, instance, **kwargs):
+    '''Records the species metadata a line belonged to before it is
+    saved, so that moving it to another one invalidates both.'''
+    instance._cache_previous_meta_id = None if instance.pk is None else \
+        Line.objects.filter(pk=instance.pk).values_list(
+            'meta_id', flat=True).first()
+
+
+def _invalidate_sender(sender, instance, **kwargs):
+    if sender is not Line:
+        invalidate(sender)
+        return
+    invalidate(Line, instance.meta_id)
+    previous_meta_id = getattr(instance, '_cache_previous_meta_id', None)
+    if previous_meta_id is not None and \
+            previous_meta_id != instance.meta_id:
+        invalidate(Line, previous_meta_id)
+
+
+def connect_signals():
+    '''Invalidates cached responses on every save or delete of the
+    cached models.'''
+    pre_save.connect(_remember_line_meta, sender=Line,
+                     dispatch_uid='data.cache.pre_save.Line')
+    for model in CACHED_MODELS:
+        post_save.connect(_invalidate_sender, sender=model,
+                          dispatch_uid=f'data.cache.save.{model.__name__}')
+        post_delete.connect(
+            _invalidate_sender, sender=model,
+            dispatch_uid=f'data.cache.delete.{model.__name__}')
+
+
+class CachedResponseMixin:
+    '''
+    Caches the responses of successful GET requests of a view set, up
+    to DATA_RESPONSE_CACHE_MAX_BYTES, keyed by the normalized path and
+    query parameters, the accepted media type and the versions of the
+    models in cache_models.
+    Responses carry an ETag derived from the same key and a
+    Last-Modified header from the versions, so clients polling for
+    changes can revalidate with If-None-Match or If-Modified-Since and
+    get a 304 without the main query running at all.
+    '''
+    cache_models = []
+
+    def get_cache_meta_ids(self, request):
+        """Return the species metadata ids a request is limited to, to
+        use the versions of their lines, or None."""
+        return None
+
+    def _get_cache_key(self, request):
+        """Return the hash keying the response to a request, and the
+        time its models last changed."""
+        params = urlencode(sorted(
+            (key, value) for key, values in request.GET.lists()
+            for value in values))
+        versions = get_versions(self.cache_models,
+                                self.get_cache_meta_ids(request))
+        key = hashlib.sha256('\n'.join([
+            request.path, params, request.META.get('HTTP_ACCEPT', ''),
+            *(str(history_id) for history_id, _ in versions)]).encode()
+        ).hexdigest()
+        timestamps = [timestamp for _, timestamp in versions
+                      if timestamp is not None]
+        return key, max(timestamps, default=None)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not self.cache_models:
+            return super().dispatch(request, *args, **kwargs)
+        key, last_modified = self._get_cache_key(request)
+        etag = quote_etag(key)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        cached = _cache().get(f'data:response:{key}')
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            if len(response.content) <= \
+                    settings.DATA_RESPONSE_CACHE_MAX_BYTES:
+                _cache().set(f'data:response:{key}',
+                             (response.content, response['Content-Type']),
+                             timeout=settings.DATA_RESPONSE_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,97 @@
+"""
+Fingerprints and derived fields of species molecules.
+"""
+import selfies as sf
+from django.db.models.signals import pre_save
+from rdkit import Chem
+from rdkit.Chem import Descriptors, rdFingerprintGenerator
+
+PATTERN_FP_SIZE = 2048
+
+MORGAN_FP_RADIUS = 2
+MORGAN_FP_SIZE = 2048
+
+_morgan_generator = rdFingerprintGenerator.GetMorganGenerator(
+    radius=MORGAN_FP_RADIUS, fpSize=MORGAN_FP_SIZE)
+
+
+def to_mol(value):
+    '''Returns an RDKit molecule from a molecule or a SMILES string.'''
+    if isinstance(value, Chem.Mol):
+        return value
+    return Chem.MolFromSmiles(value)
+
+
+def pattern_fp_bits(mol):
+    '''
+    Returns the on bits of the RDKit pattern fingerprint of a molecule.
+    The bits of a substructure query are a subset of the bits of every
+    molecule it matches, so containment of the bits screens out most
+    molecules before the exact substructure match.
+    '''
+    return list(Chem.PatternFingerprint(
+        mol, fpSize=PATTERN_FP_SIZE).GetOnBits())
+
+
+def query_pattern_fp_bits(smarts):
+    '''Returns the pattern fingerprint bits of a SMARTS substructure
+    query, or None if it cannot be parsed.'''
+    query = Chem.MolFromSmarts(smarts)
+    if query is None:
+        return None
+    return pattern_fp_bits(query)
+
+
+def morgan_fp(mol):
+    '''Returns the Morgan fingerprint of a molecule as a bit vector.'''
+    return _morgan_generator.GetFingerprint(mol)
+
+
+def fingerprints(mol):
+    '''Returns the stored fingerprint fields of a species molecule.'''
+    return {'pattern_fp': pattern_fp_bits(mol), 'morgan_fp': morgan_fp(mol)}
+
+
+def _fill_fingerprints(sender, instance, update_fields=None, **kwargs):
+    '''Computes the fingerprints of a species from its mol_obj before it
+    is saved, so that they never describe another molecule.'''
+    if update_fields is not None and 'mol_obj' not in update_fields:
+        return
+    mol = to_mol(instance.mol_obj) if instance.mol_obj else None
+    if mol is None:
+        instance.pattern_fp = instance.morgan_fp = None
+    else:
+        instance.pattern_fp = pattern_fp_bits(mol)
+        instance.morgan_fp = morgan_fp(mol)
+
+
+def connect_signals():
+    '''Computes the fingerprints of species on every save. The species
+    model is imported here, so that worker processes can import this
+    module without the app registry.'''
+    from core.models import Species
+    pre_save.connect(_fill_fingerprints, sender=Species,
+                     dispatch_uid='data.chem.pre_save.Species')
+
+
+def species_fields(smiles):
+    '''
+    Computes the fields of a species derived from its SMILES: the
+    canonical SMILES, SELFIES, exact molecular mass, rdkit mol object
+    and fingerprints. Returns the fields and None, or None and an error
+    message if the SMILES cannot be processed. Everything returned can
+    be pickled, so that it can run in the worker processes of bulk
+    species creation.
+    '''
+    mol = Chem.MolFromSmiles(smiles) if smiles else None
+    if mol is None:
+        return None, f'Invalid SMILES {smiles!r}.'
+    canonical_smiles = Chem.MolToSmiles(mol)
+    try:
+        selfies_string = sf.encoder(canonical_smiles)
+    except sf.EncoderError as error:
+        return None, str(error)
+    mol = Chem.MolFromSmiles(canonical_smiles)
+    return {'smiles': canonical_smiles, 'selfies': selfies_string,
+            'molecular_mass': Descriptors.ExactMolWt(mol), 'mol_obj': mol,
+            **fingerprints(mol)}, None
@@ -0,0 +1,101 @@
+"""
+Cache of the molecules and fields derived from SMILES strings.
+"""
+import functools
+
+import selfies as sf
+from django.conf import settings
+from rdkit import Chem, DataStructs
+from rdkit.Chem import Descriptors
+
+from data import chem
+
+_lru_cache = functools.lru_cache(maxsize=settings.CHEM_CACHE_SIZE)
+
+
+@_lru_cache
+def _mol_from_smiles(smiles):
+    return Chem.MolFromSmiles(smiles)
+
+
+def mol_from_smiles(smiles):
+    '''
+    Returns the RDKit molecule of a SMILES string, or None if it cannot
+    be parsed. Molecules are mutable, so every call gets a copy of the
+    cached one.
+    '''
+    mol = _mol_from_smiles(smiles)
+    return None if mol is None else Chem.Mol(mol)
+
+
+@_lru_cache
+def canonical_smiles(smiles):
+    '''Returns the canonical form of a SMILES string, or None if it
+    cannot be parsed.'''
+    mol = _mol_from_smiles(smiles)
+    return None if mol is None else Chem.MolToSmiles(mol)
+
+
+@_lru_cache
+def selfies_encoder(smiles):
+    '''Returns the SELFIES of a SMILES string, raising
+    selfies.EncoderError if it cannot be encoded.'''
+    return sf.encoder(smiles)
+
+
+@_lru_cache
+def molecular_mass(smiles):
+    '''Returns the exact molecular mass of a SMILES string, or None if
+    it cannot be parsed.'''
+    mol = _mol_from_smiles(smiles)
+    return None if mol is None else Descriptors.ExactMolWt(mol)
+
+
+@_lru_cache
+def _species_fields(smiles):
+    return chem.species_fields(smiles)
+
+
+def species_fields(smiles):
+    '''Returns chem.species_fields of a SMILES string, with copies of
+    the cached mol object and fingerprints.'''
+    fields, error = _species_fields(smiles)
+    if fields is None:
+        return None, error
+    return {**fields, 'mol_obj': Chem.Mol(fields['mol_obj']),
+            'pattern_fp': list(fields['pattern_fp']),
+            'morgan_fp': DataStructs.ExplicitBitVect(
+                fields['morgan_fp'].ToBinary())}, None
+
+
+@_lru_cache
+def _query_pattern_fp_bits(smarts):
+    bits = chem.query_pattern_fp_bits(smarts)
+    return None if bits is None else tuple(bits)
+
+
+def query_pattern_fp_bits(smarts):
+    '''Returns chem.query_pattern_fp_bits of a SMARTS substructure
+    query.'''
+    bits = _query_pattern_fp_bits(smarts)
+    return None if bits is None else list(bits)
+
+
+_CACHED = {'mol_from_smiles': _mol_from_smiles,
+           'canonical_smiles': canonical_smiles,
+           'selfies_encoder': selfies_encoder,
+           'molecular_mass': molecular_mass,
+           'species_fields': _species_fields,
+           'query_pattern_fp_bits': _query_pattern_fp_bits}
+
+
+def cache_info():
+    '''Returns the hits, misses, maxsize and currsize of every cache of
+    this process, by function name.'''
+    return {name: function.cache_info()._asdict()
+            for name, function in _CACHED.items()}
+
+
+def cache_clear():
+    for function in _CACHED.values():
+        function.cache_clear()
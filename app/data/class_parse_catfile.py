@@ -472,8 +472,18 @@ class PartitionFunction(object):
         self.vib_is_K = vib_is_K
         self.notes = notes
         self.flag = None
-
-        self._setup()
+        self._interpolator = None
+
+        # read the info from the qpart file if there is one, otherwise
+        # pick the method from what was given
+        if self.qpart_file is not None:
+            self._setup()
+        elif self.form in ['poly', 'polynomial', 'power', 'pow', 'rotcons']:
+            self.flag = 'functional'
+        elif self.temps is not None and self.vals is not None:
+            self.flag = 'interpolation'
+        elif self.mol is not None or self.gs is not None:
+            self.flag = 'counting'
         self._check_functional()
 
         return
@@ -551,11 +561,28 @@ class PartitionFunction(object):
         else:
             return True
 
+    def _interpolate(self, T):
+        '''
+        Interpolate the partition function values at temperature T,
+        building the interpolator on first use only.
+        '''
+
+        if self._interpolator is None:
+            self._interpolator = interp1d(
+                self.temps, self.vals, fill_value='extrapolate')
+        return self._interpolator(T)
+
     def qrot(self, T):
         '''
         Calculate and return the rotational partition function at temperature T
+
+        T can be a number or an array of temperatures, in which case an
+        array of the same shape is returned.
         '''
 
+        if not np.isscalar(T):
+            T = np.asarray(T, dtype=np.float64)
+
         # if the user specified one of the allowed functional forms
         if self.flag == 'functional':
 
@@ -601,8 +628,8 @@ class PartitionFunction(object):
 
         # if the user provided arrays for interpolation
         if self.flag == 'interpolation':
-            f = interp1d(self.temps, self.vals, fill_value='extrapolate')
-            return f(T).tolist()
+            qrot = self._interpolate(T)
+            return qrot.item() if np.ndim(qrot) == 0 else qrot
 
         # if the user provided a catalog or gs and energies
         if self.flag == 'counting':
@@ -614,30 +641,38 @@ class PartitionFunction(object):
             else:
                 gs = self.gs
                 energies = self.energies
-            return (1/self.sigma)*np.sum(gs*np.exp(-energies/T))
+            return (1/self.sigma)*np.sum(
+                gs*np.exp(-energies/np.asarray(T)[..., np.newaxis]),
+                axis=-1)
 
     def qvib(self, T):
         '''
         Calculate and return the vibrational partition
         function at temperature T
+
+        T can be a number or an array of temperatures, in which case an
+        array of the same shape is returned.
         '''
 
         # if there's no states specified, return 1.
         if self.vib_states is None:
             return 1.
 
-        # otherwise do the calculation and return based on the units
-        if self.vib_is_K is True:
-            return np.prod(np.sum(np.exp((
-                -self.vib_states[:, np.newaxis]*np.arange(100))/(T)), axis=1))
-        else:
-            return np.prod(np.sum(np.exp((
-                -self.vib_states[:, np.newaxis] *
-                np.arange(100))/(0.695*T)), axis=1))
+        # otherwise do the calculation and return based on the units,
+        # with the temperatures on the leading axes
+        T = np.asarray(T, dtype=np.float64)[..., np.newaxis, np.newaxis]
+        if self.vib_is_K is not True:
+            T = 0.695*T
+        return np.prod(np.sum(np.exp((
+            -self.vib_states[:, np.newaxis]*np.arange(100))/T), axis=-1),
+            axis=-1)
 
     def q(self, T):
         '''
         Calculate and return the total partition function at a temperature T
+
+        T can be a number or an array of temperatures, in which case an
+        array of the same shape is returned.
         '''
 
         return self.qrot(T)*self.qvib(T)
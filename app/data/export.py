@@ -0,0 +1,190 @@
+"""
+Columnar binary export of lines.
+"""
+import itertools
+import json
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from core.models import Line
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ['arrow', 'parquet', 'npz']
+
+CONTENT_TYPES = {'arrow': 'application/vnd.apache.arrow.file',
+                 'parquet': 'application/vnd.apache.parquet',
+                 'npz': 'application/octet-stream'}
+
+# Exported line fields and their column types. Decimal fields are cast
+# to double precision by the database.
+COLUMNS = [('id', np.int64), ('meta_id', np.int64), ('measured', np.bool_),
+           ('frequency', np.float64), ('uncertainty', np.float64),
+           ('intensity', np.float64), ('s_ij', np.float64),
+           ('s_ij_mu2', np.float64), ('a_ij', np.float64),
+           ('lower_state_energy', np.float64),
+           ('upper_state_energy', np.float64),
+           ('lower_state_degeneracy', np.int32),
+           ('upper_state_degeneracy', np.int32),
+           ('rovibrational', np.bool_), ('pickett_qn_code', np.int32)]
+
+_FLOAT_FIELDS = {name for name, dtype in COLUMNS if dtype is np.float64}
+
+# Quantum numbers missing from a line of a .npz export, where integer
+# columns cannot be null. Arrow and Parquet exports use nulls.
+QN_MISSING = np.iinfo(np.int32).min
+
+
+def default_format():
+    '''Returns Arrow if pyarrow is installed, .npz otherwise.'''
+    return 'arrow' if pyarrow is not None else 'npz'
+
+
+def _load_qn(qn):
+    '''Quantum numbers may be stored as a JSON object or as JSON text.'''
+    return json.loads(qn) if isinstance(qn, str) else qn
+
+
+def qn_labels(meta_ids):
+    '''
+    Returns the quantum number labels of the lines of species metadata,
+    in the order of their first line, so each metadata costs one line
+    read through the (meta, frequency) index.
+    '''
+    labels = {}
+    for meta_id in meta_ids:
+        qn = Line.objects.filter(meta_id=meta_id).values_list(
+            'lower_state_qn', flat=True).first()
+        if qn is not None:
+            labels.update(dict.fromkeys(_load_qn(qn)))
+    return list(labels)
+
+
+def _chunk_columns(rows, labels):
+    '''Converts a chunk of rows into column arrays, with the quantum
+    numbers expanded into masked int32 columns.'''
+    values = list(zip(*rows)) or [()] * (len(COLUMNS) + 2)
+    columns = {name: np.array(column, dtype=dtype)
+               for (name, dtype), column in zip(COLUMNS, values)}
+    for state, qns in zip(['lower', 'upper'], values[len(COLUMNS):]):
+        qns = [_load_qn(qn) for qn in qns]
+        for label in labels:
+            column = [qn.get(label) for qn in qns]
+            mask = np.array([value is None for value in column])
+            columns[f'{state}_state_qn_{label}'] = np.ma.masked_array(
+                [QN_MISSING if value is None else value for value in column],
+                mask=mask, dtype=np.int32, fill_value=QN_MISSING)
+    return columns
+
+
+class _NpzWriter:
+    '''
+    Writes columns chunk by chunk into a compressed .npz file. Every
+    column is spooled to its own temporary file and copied into the zip
+    archive behind its .npy header at the end, so the row count does not
+    have to be known up front and memory use stays at one chunk.
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.columns = {}
+
+    def write(self, columns):
+        for name, column in columns.items():
+            if name not in self.columns:
+                self.columns[name] = [tempfile.TemporaryFile(), column.dtype,
+                                      0]
+            spool = self.columns[name]
+            spool[0].write(np.ma.filled(column).tobytes())
+            spool[2] += len(column)
+
+    def close(self):
+        with zipfile.ZipFile(self.file, 'w', zipfile.ZIP_DEFLATED) as npz:
+            for name, (spool, dtype, length) in self.columns.items():
+                spool.seek(0)
+                with npz.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, {
+                        'descr': np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False, 'shape': (length,)})
+                    shutil.copyfileobj(spool, member)
+                spool.close()
+
+
+class _ArrowWriter:
+    '''Writes columns chunk by chunk as record batches of an Arrow IPC
+    file or row groups of a Parquet file, compressed with zstd.'''
+
+    def __init__(self, file, file_format):
+        self.file = file
+        self.file_format = file_format
+        self.writer = None
+
+    def write(self, columns):
+        batch = pyarrow.RecordBatch.from_pydict({
+            name: pyarrow.array(np.ma.getdata(column),
+                                mask=np.ma.getmaskarray(column))
+            for name, column in columns.items()})
+        if self.writer is None:
+            if self.file_format == 'parquet':
+                self.writer = pyarrow.parquet.ParquetWriter(
+                    self.file, batch.schema, compression='zstd')
+            else:
+                self.writer = pyarrow.ipc.new_file(
+                    self.file, batch.schema,
+                    options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+        if self.file_format == 'parquet':
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def export_lines(meta_ids, file, file_format=None, chunk_size=None):
+    '''
+    Writes the lines of species metadata to a binary file as columns:
+    float64 values, integer degeneracies and codes, and one int32 column
+    per state and quantum number label. The lines are read in id order
+    from a server-side cursor chunk_size at a time, so memory use does
+    not grow with the number of lines. file_format is 'arrow' (Arrow IPC),
+    'parquet' or 'npz' (compressed NumPy); the first two need pyarrow.
+    Returns the number of lines written.
+    '''
+    file_format = file_format or default_format()
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown export format {file_format}.')
+    if file_format != 'npz' and pyarrow is None:
+        raise ValueError(f'Exporting to {file_format} requires pyarrow.')
+    chunk_size = chunk_size or settings.LINE_EXPORT_CHUNK_SIZE
+    labels = qn_labels(meta_ids)
+    fields = [Cast(name, FloatField()) if name in _FLOAT_FIELDS else name
+              for name, _ in COLUMNS]
+    rows = Line.objects.filter(meta_id__in=meta_ids).order_by('id') \
+        .values_list(*fields, 'lower_state_qn', 'upper_state_qn') \
+        .iterator(chunk_size=chunk_size)
+    writer = _NpzWriter(file) if file_format == 'npz' else \
+        _ArrowWriter(file, file_format)
+    count = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        # An export without lines still gets its columns.
+        if chunk or not count:
+            writer.write(_chunk_columns(chunk, labels))
+        count += len(chunk)
+        if len(chunk) < chunk_size:
+            break
+    writer.close()
+    return count
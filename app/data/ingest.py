@@ -0,0 +1,306 @@
+"""
+Fast paths for saving lines parsed from .cat files and species in bulk.
+"""
+import csv
+import io
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rdkit import Chem
+from simple_history.utils import bulk_create_with_history
+
+from core.models import Line, Species
+from data import cache, chem
+
+BULK_CREATE_BATCH_SIZE = 5000
+
+# Columns written by copy_lines, in the order of the rows of
+# _copy_rows.
+COPY_FIELDS = ['meta', 'measured', 'frequency', 'uncertainty', 'intensity',
+               's_ij', 's_ij_mu2', 'a_ij', 'lower_state_energy',
+               'upper_state_energy', 'lower_state_degeneracy',
+               'upper_state_degeneracy', 'lower_state_qn', 'upper_state_qn',
+               'rovibrational', 'vib_qn', 'pickett_qn_code',
+               'pickett_lower_state_qn', 'pickett_upper_state_qn', 'notes']
+
+_COPY_STAGING_TABLE = 'line_copy_staging'
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t',
+                               '\n': '\\n', '\r': '\\r'})
+
+
+def _decimal(value):
+    '''Converts a float the way DRF's DecimalField does.'''
+    return Decimal(str(value).strip())
+
+
+def _decimal_4f(value):
+    '''Converts a float rounded to the 4 decimals SPCAT writes.'''
+    return Decimal(format(value, '.4f'))
+
+
+def is_finite(parsed_cat):
+    '''Checks that every computed value of a parsed .cat file can be
+    stored as a number.'''
+    return all(np.isfinite(np.asarray(column, dtype=np.float64)).all()
+               for column in (parsed_cat.frequency, parsed_cat.freq_err,
+                              parsed_cat.logint, parsed_cat.sijmu,
+                              parsed_cat.aij, parsed_cat.elow,
+                              parsed_cat.eup))
+
+
+def build_lines(parsed_cat, meta_id, measured, contains_rovibrational,
+                vib_qn, notes):
+    '''
+    Builds unsaved Line objects straight from the arrays of a parsed
+    .cat file, converting the values like LineSerializerList would.
+    '''
+    lines = []
+    for i in range(len(parsed_cat.frequency)):
+        lower_state_qn = parsed_cat.lower_state_qn_dict_list[i]
+        upper_state_qn = parsed_cat.upper_state_qn_dict_list[i]
+        lines.append(Line(
+            meta_id=meta_id,
+            measured=measured,
+            frequency=_decimal_4f(parsed_cat.frequency[i]),
+            uncertainty=_decimal_4f(parsed_cat.freq_err[i]),
+            intensity=_decimal_4f(parsed_cat.logint[i]),
+            s_ij=None,
+            s_ij_mu2=_decimal(parsed_cat.sijmu[i]),
+            a_ij=_decimal(parsed_cat.aij[i]),
+            lower_state_energy=_decimal(parsed_cat.elow[i]),
+            upper_state_energy=_decimal(parsed_cat.eup[i]),
+            lower_state_degeneracy=int(parsed_cat.glow[i]),
+            upper_state_degeneracy=int(parsed_cat.gup[i]),
+            lower_state_qn=lower_state_qn,
+            upper_state_qn=upper_state_qn,
+            rovibrational=contains_rovibrational and
+            lower_state_qn[vib_qn] != upper_state_qn[vib_qn],
+            vib_qn=vib_qn,
+            pickett_qn_code=int(parsed_cat.qnformat[i]),
+            pickett_lower_state_qn=str(parsed_cat.qnlow_str[i]),
+            pickett_upper_state_qn=str(parsed_cat.qnup_str[i]),
+            notes=notes))
+    return lines
+
+
+def bulk_create_lines(parsed_cat, meta_id, measured, contains_rovibrational,
+                      vib_qn, notes, user=None, change_reason=None,
+                      batch_size=BULK_CREATE_BATCH_SIZE):
+    '''
+    Saves the lines of a parsed .cat file with bulk_create, skipping
+    per-row serializer validation, and their history rows with
+    bulk_create_with_history, all with the same user and change reason.
+    Meant for values computed by parse_cat, so check them with is_finite
+    first. Cached line responses are invalidated, as bulk_create sends no
+    post_save signals. Returns the saved lines with their ids.
+    '''
+    lines = bulk_create_with_history(
+        build_lines(parsed_cat, meta_id, measured, contains_rovibrational,
+                    vib_qn, notes),
+        Line, batch_size=batch_size, default_user=user,
+        default_change_reason=change_reason)
+    cache.invalidate(Line, meta_id)
+    return lines
+
+
+def _copy_text(value):
+    '''Escapes a string for the PostgreSQL COPY text format.'''
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy_rows(parsed_cat, meta_id, measured, contains_rovibrational,
+               vib_qn, notes):
+    '''
+    Yields the lines of a parsed .cat file as rows of the PostgreSQL
+    COPY text format, with the values converted like build_lines does,
+    the quantum number dictionaries taken from their pre-encoded JSON
+    and rovibrational from the integer quantum number columns, so the
+    .cat file has to be parsed with qn_json.
+    '''
+    measured = 't' if measured else 'f'
+    vib_qn_text = _copy_text(vib_qn)
+    notes = _copy_text(notes)
+    if contains_rovibrational:
+        vib_index = parsed_cat.qn_labels.index(vib_qn)
+        rovibrational = (parsed_cat.lower_state_qns[:, vib_index] !=
+                         parsed_cat.upper_state_qns[:, vib_index]).tolist()
+    else:
+        rovibrational = [False] * len(parsed_cat.frequency)
+    for i in range(len(parsed_cat.frequency)):
+        yield '\t'.join([
+            str(meta_id),
+            measured,
+            format(parsed_cat.frequency[i], '.4f'),
+            format(parsed_cat.freq_err[i], '.4f'),
+            format(parsed_cat.logint[i], '.4f'),
+            '\\N',
+            str(parsed_cat.sijmu[i]),
+            str(parsed_cat.aij[i]),
+            str(parsed_cat.elow[i]),
+            str(parsed_cat.eup[i]),
+            str(int(parsed_cat.glow[i])),
+            str(int(parsed_cat.gup[i])),
+            _copy_text(parsed_cat.lower_state_qn_json[i]),
+            _copy_text(parsed_cat.upper_state_qn_json[i]),
+            't' if rovibrational[i] else 'f',
+            vib_qn_text,
+            str(int(parsed_cat.qnformat[i])),
+            _copy_text(parsed_cat.qnlow_str[i]),
+            _copy_text(parsed_cat.qnup_str[i]),
+            notes]) + '\n'
+
+
+class _RowStream(io.TextIOBase):
+    '''
+    Read-only file over an iterator of text rows, so copy_expert can
+    pull the COPY data lazily instead of from one big string.
+    '''
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._rows)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def copy_lines(parsed_cat, meta_id, measured, contains_rovibrational,
+               vib_qn, notes, user=None, change_reason=None):
+    '''
+    Saves the lines of a parsed .cat file with PostgreSQL
+    COPY ... FROM STDIN, from a .cat file parsed with qn_json. Like
+    bulk_create_lines it skips serializer validation, so check the
+    values with is_finite first. The rows are
+    copied into a temporary staging table and moved to the line table
+    and its history table in one INSERT ... SELECT, with the same user
+    and change reason on every history row, and cached line responses
+    are invalidated. Returns the number of lines saved.
+    '''
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(Line._meta.get_field(field).column)
+                        for field in COPY_FIELDS)
+    line_table = quote_name(Line._meta.db_table)
+    history_table = quote_name(Line.history.model._meta.db_table)
+    stream = _RowStream(_copy_rows(
+        parsed_cat, meta_id, measured, contains_rovibrational, vib_qn,
+        notes))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE {_COPY_STAGING_TABLE} AS '
+                       f'SELECT {columns} FROM {line_table} WITH NO DATA')
+        cursor.copy_expert(
+            f'COPY {_COPY_STAGING_TABLE} ({columns}) FROM STDIN', stream)
+        cursor.execute(
+            f'WITH new_lines AS ('
+            f'INSERT INTO {line_table} ({columns}) '
+            f'SELECT {columns} FROM {_COPY_STAGING_TABLE} '
+            f'RETURNING id, {columns}) '
+            f'INSERT INTO {history_table} (id, {columns}, history_date, '
+            f'history_change_reason, history_type, history_user_id) '
+            f'SELECT id, {columns}, %s, %s, %s, %s FROM new_lines',
+            [timezone.now(), change_reason, '+',
+             user.pk if user is not None else None])
+        cursor.execute(f'DROP TABLE {_COPY_STAGING_TABLE}')
+        cache.invalidate(Line, meta_id)
+    return len(parsed_cat.frequency)
+
+
+def _species_name(value):
+    '''Reads the names of a species from a JSON list, or a single
+    name.'''
+    try:
+        name = json.loads(value)
+    except ValueError:
+        return [value]
+    return name if isinstance(name, list) else [value]
+
+
+def read_species_csv(file):
+    '''
+    Reads species rows from a CSV file with a header of species fields.
+    The name column holds a JSON list of names or a single name.
+    '''
+    rows = []
+    for row in csv.DictReader(io.TextIOWrapper(file, encoding='utf-8')):
+        if row.get('name'):
+            row['name'] = _species_name(row['name'])
+        rows.append(row)
+    return rows
+
+
+def read_species_sdf(file):
+    '''
+    Reads species rows from an SDF file: the SMILES of every molecule
+    and its data items named like species fields, with the molecule
+    title as its name unless a name item is given. Molecules that cannot
+    be read give None rows.
+    '''
+    rows = []
+    for mol in Chem.ForwardSDMolSupplier(file):
+        if mol is None:
+            rows.append(None)
+            continue
+        row = {key: str(value) for key, value in mol.GetPropsAsDict().items()}
+        row['name'] = _species_name(row['name']) if 'name' in row else \
+            [mol.GetProp('_Name')]
+        row['smiles'] = Chem.MolToSmiles(mol)
+        rows.append(row)
+    return rows
+
+
+def compute_species_fields(smiles_list, workers=None):
+    '''
+    Runs chem.species_fields over SMILES in a pool of worker processes,
+    or in this process when there are fewer than
+    SPECIES_BULK_PARALLEL_MIN_ROWS of them, as starting the pool would
+    cost more. The workers are spawned rather than forked, so that they
+    do not inherit the database connections and locks of the server.
+    Returns the (fields, error) pairs in the order of smiles_list.
+    '''
+    workers = workers or settings.SPECIES_BULK_WORKERS or \
+        multiprocessing.cpu_count()
+    if workers == 1 or \
+            len(smiles_list) < settings.SPECIES_BULK_PARALLEL_MIN_ROWS:
+        return [chem.species_fields(smiles) for smiles in smiles_list]
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(
+            chem.species_fields, smiles_list,
+            chunksize=max(1, len(smiles_list) // (workers * 4))))
+
+
+def bulk_create_species(species, user=None, change_reason=None,
+                        batch_size=BULK_CREATE_BATCH_SIZE):
+    '''
+    Saves unsaved Species objects with bulk_create and their history
+    rows with bulk_create_with_history, all with the same user and change
+    reason. Cached species responses are invalidated, as bulk_create
+    sends no post_save signals. Returns the saved species with their
+    ids.
+    '''
+    species = bulk_create_with_history(
+        species, Species, batch_size=batch_size, default_user=user,
+        default_change_reason=change_reason)
+    cache.invalidate(Species)
+    return species
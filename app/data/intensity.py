@@ -0,0 +1,62 @@
+"""
+Line intensities rescaled to other temperatures.
+"""
+import numpy as np
+
+from core.models import SpeciesMetadata
+from data.partition import get_partition_function
+
+# Reciprocal of the SPCAT intensity constant, as in
+# Catalog._set_sijmu_aij.
+INTENSITY_CONSTANT = 2.40251E4
+
+
+def scaled_intensity(s_ij_mu2, frequency, lower_state_energy,
+                     upper_state_energy, partition_function, temperature):
+    '''
+    Returns the log10 intensities [log10(nm^2 MHz)] of lines at a
+    temperature [K], inverting Catalog._set_sijmu_aij with the rotational
+    partition function at that temperature instead of at 300 K. Energies
+    are in K. Lines whose intensity is not a finite number come out as
+    NaN.
+    '''
+    s_ij_mu2 = np.asarray(s_ij_mu2, dtype=np.float64)
+    frequency = np.asarray(frequency, dtype=np.float64)
+    lower_state_energy = np.asarray(lower_state_energy, dtype=np.float64)
+    upper_state_energy = np.asarray(upper_state_energy, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        intensity = s_ij_mu2 * frequency * \
+            (np.exp(-lower_state_energy/temperature) -
+             np.exp(-upper_state_energy/temperature)) / \
+            (INTENSITY_CONSTANT * partition_function.qrot(temperature))
+        logint = np.log10(intensity)
+    logint[~np.isfinite(logint)] = np.nan
+    return logint
+
+
+def scaled_intensities(rows, temperature):
+    '''
+    Returns the intensities of queried line rows at a temperature, in
+    the order of the rows, computed species metadata by species metadata
+    with their cached partition functions. The rows need meta_id,
+    s_ij_mu2, frequency, lower_state_energy and upper_state_energy
+    fields. Intensities that cannot be computed are None.
+    '''
+    if not rows:
+        return []
+    meta_ids = np.array([row.meta_id for row in rows])
+    columns = np.array(
+        [(row.s_ij_mu2, row.frequency, row.lower_state_energy,
+          row.upper_state_energy) for row in rows],
+        dtype=np.float64)
+    logint = np.full(len(rows), np.nan)
+    metas = SpeciesMetadata.objects.filter(
+        id__in=np.unique(meta_ids).tolist()).only(
+            'id', 'partition_function', 'qpart_file')
+    for meta in metas:
+        if not meta.qpart_file or not meta.partition_function:
+            continue
+        in_meta = meta_ids == meta.id
+        logint[in_meta] = scaled_intensity(
+            *columns[in_meta].T, get_partition_function(meta), temperature)
+    return [None if np.isnan(value) else float(value) for value in logint]
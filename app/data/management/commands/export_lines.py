@@ -0,0 +1,52 @@
+"""
+Django command to export lines as a columnar binary file.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import SpeciesMetadata
+from data import export
+
+
+class Command(BaseCommand):
+    """Django command to export the lines of linelists or species
+    metadata"""
+    help = ('Export the lines of linelists or species metadata to an '
+            'Arrow IPC, Parquet or compressed NumPy .npz file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output')
+        parser.add_argument('--linelist', type=int, action='append',
+                            default=[], help='Id of a linelist to export; '
+                            'may be repeated')
+        parser.add_argument('--meta', type=int, action='append',
+                            default=[], help='Id of a species metadata to '
+                            'export; may be repeated')
+        parser.add_argument('--file-format', choices=export.FORMATS,
+                            help='By default the extension of the output '
+                            'file, or arrow if pyarrow is installed and '
+                            'npz otherwise')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Fetch this many lines at a time')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        if not options['linelist'] and not options['meta']:
+            raise CommandError('Give at least one --linelist or --meta.')
+        meta_ids = options['meta'] + list(SpeciesMetadata.objects.filter(
+            linelist_id__in=options['linelist']).values_list(
+                'id', flat=True))
+        extension = os.path.splitext(options['output'])[1].lstrip('.')
+        file_format = options['file_format'] or (
+            extension if extension in export.FORMATS
+            else export.default_format())
+        try:
+            with open(options['output'], 'wb') as output:
+                count = export.export_lines(
+                    meta_ids, output, file_format, options['chunk_size'])
+        except ValueError as exception:
+            os.remove(options['output'])
+            raise CommandError(str(exception))
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} lines to {options["output"]}.'))
@@ -0,0 +1,81 @@
+"""
+Django command to load the lines of a .cat file with PostgreSQL COPY.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import SpeciesMetadata
+from data import ingest
+from data.parse_line import parse_cat, iter_parse_cat
+from data.partition import get_partition_function
+
+
+class Command(BaseCommand):
+    """Django command to load a .cat file into the line table"""
+    help = ('Load the lines of a .cat file for a species metadata '
+            'with COPY ... FROM STDIN.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('meta_id', type=int)
+        parser.add_argument('cat_file')
+        parser.add_argument('--qn-labels', required=True,
+                            help='Comma separated quantum number labels, '
+                            'e.g. J,Ka,Kc')
+        parser.add_argument('--vib-qn', default='',
+                            help='Label of the vibrational quantum number '
+                            'of catalogs with rovibrational lines')
+        parser.add_argument('--notes', default='')
+        parser.add_argument('--change-reason',
+                            help='Change reason of the history rows, '
+                            'by default naming the .cat file')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Parse and copy this many lines at a time')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        try:
+            meta = SpeciesMetadata.objects.get(id=options['meta_id'])
+        except SpeciesMetadata.DoesNotExist:
+            raise CommandError(
+                f"Species metadata {options['meta_id']} does not exist.")
+        qn_label_list = options['qn_labels'].split(',')
+        vib_qn = options['vib_qn']
+        if vib_qn and vib_qn not in qn_label_list:
+            raise CommandError('Vibrational quantum number label must be '
+                               'in quantum number label string.')
+        if not meta.qpart_file:
+            raise CommandError('The species metadata does not have a '
+                               'qpart file.')
+        partition_function = get_partition_function(meta)
+        change_reason = options['change_reason'] or \
+            f"Upload of {os.path.basename(options['cat_file'])}"
+        count = 0
+        with open(options['cat_file'], 'rb') as cat_file:
+            try:
+                with transaction.atomic():
+                    if options['chunk_size']:
+                        parsed_cats = iter_parse_cat(
+                            cat_file, qn_label_list, options['chunk_size'],
+                            partition_function=partition_function,
+                            qn_json=True)
+                    else:
+                        parsed_cats = [parse_cat(
+                            cat_file, qn_label_list,
+                            partition_function=partition_function,
+                            qn_json=True)]
+                    for parsed_cat in parsed_cats:
+                        if not ingest.is_finite(parsed_cat):
+                            raise CommandError(
+                                'The .cat file gives values that are not '
+                                'finite numbers.')
+                        count += ingest.copy_lines(
+                            parsed_cat, meta.id, False, bool(vib_qn),
+                            vib_qn, options['notes'],
+                            change_reason=change_reason)
+            except ValueError:
+                raise CommandError('Quantum number labels do not match the '
+                                   'number of quantum numbers in .cat file.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {count} lines for species metadata {meta.id}.'))
@@ -0,0 +1,94 @@
+"""
+Pagination for data APIs.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class FrequencyKeysetPagination(BasePagination):
+    """
+    Keyset pagination of lines ordered by (frequency, id). The next
+    token encodes the key of the last line of a page, so every page is
+    a range scan from that key instead of an OFFSET. Frequencies are
+    compared through the frequency_float alias of
+    LineQuerySet.alias_frequency_float, matching the frequency index.
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    max_page_size = 10000
+
+    def get_page_size(self, request):
+        """Return the requested page size, or None if the request
+        does not ask for pagination."""
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None:
+            return None
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError(
+                {self.page_size_query_param: 'A valid integer is required.'})
+        if page_size < 1:
+            raise ValidationError(
+                {self.page_size_query_param:
+                 'Ensure this value is greater than or equal to 1.'})
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, line):
+        """Encode the key of a line as a next token."""
+        key = json.dumps([str(line.frequency), line.id])
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """Decode a next token into a (frequency, id) key."""
+        try:
+            frequency, line_id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()))
+            return float(frequency), int(line_id)
+        except (binascii.Error, UnicodeDecodeError, TypeError,
+                ValueError):
+            raise ValidationError(
+                {self.cursor_query_param: 'Invalid cursor.'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page of a queryset ordered by (frequency, id)
+        after the key of the requested cursor."""
+        self.page_size = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            frequency, line_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(frequency_float__gt=frequency) |
+                Q(frequency_float=frequency, id__gt=line_id))
+        # One extra line tells whether there is a next page.
+        page = list(queryset.order_by('frequency_float', 'id')[
+            :self.page_size + 1])
+        self.next_cursor = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_cursor),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -2,22 +2,292 @@
 SPCAT .cat file parsing script adapted from molsim package
 developed by Brett McGuire et al.
 """
+import collections
+import functools
+import itertools
+import json
 import numpy as np
 import re
 import scipy.constants
-from data.class_parse_catfile import (
-    Catalog, Level, PartitionFunction, _read_txt)
+from data.class_parse_catfile import Catalog, PartitionFunction
 
 # Boltzmann's constants in cm-1/K
 kcm = scipy.constants.k * (scipy.constants.h**-1) * \
     ((scipy.constants.c * 100)**-1)
 ccm = scipy.constants.c * 100  # speed of light in cm/s
 
+# the per-transition arrays parse_cat extracts from a .cat file. The
+# quantum numbers come as (n, len(qn_labels)) int arrays, and either as
+# dictionaries or, with qn_json, as pre-encoded JSON; the other pair
+# is None.
+ParsedCat = collections.namedtuple('ParsedCat', [
+    'frequency', 'freq_err', 'logint', 'sijmu', 'aij', 'elow', 'eup',
+    'glow', 'gup', 'qnformat', 'qnlow_str', 'qnup_str',
+    'lower_state_qn_dict_list', 'upper_state_qn_dict_list',
+    'lower_state_qn_json', 'upper_state_qn_json', 'lower_state_qns',
+    'upper_state_qns', 'qn_labels'])
+
+
+_SPCAT_LETTERS = {'A': 100,
+                  'B': 110,
+                  'C': 120,
+                  'D': 130,
+                  'E': 140,
+                  'F': 150,
+                  'G': 160,
+                  'H': 170,
+                  'I': 180,
+                  'J': 190,
+                  'K': 200,
+                  'L': 210,
+                  'M': 220,
+                  'N': 230,
+                  'O': 240,
+                  'P': 250,
+                  'Q': 260,
+                  'R': 270,
+                  'S': 280,
+                  'T': 290,
+                  'U': 300,
+                  'V': 310,
+                  'W': 320,
+                  'X': 330,
+                  'Y': 340,
+                  'Z': 350,
+                  'a': -10,
+                  'b': -20,
+                  'c': -30,
+                  'd': -40,
+                  'e': -50,
+                  'f': -60,
+                  'g': -70,
+                  'h': -80,
+                  'i': -90,
+                  'j': -100,
+                  'k': -110,
+                  'l': -120,
+                  'm': -130,
+                  'n': -140,
+                  'o': -150,
+                  'p': -160,
+                  'q': -170,
+                  'r': -180,
+                  's': -190,
+                  't': -200,
+                  'u': -210,
+                  'v': -220,
+                  'w': -230,
+                  'x': -240,
+                  'y': -250,
+                  'z': -260,
+                  }
+# spinv said the minimum quantum number is -259, but I
+# think it's a mistake, it should be able to store down to -269.
+
+
+# we use a helper to fix the letters and
+# +/- that show up in gup, and the qns, and returns floats
+# Edited by Jasmine to account for upper and lower case alphabets
+# that represent positive and negative quantum numbers respectively.
+def _fix_spcat(x):
+    '''Fixes letters in something that's read in and returns floats'''
+
+    # fix blanks - we just want them to be nice nones
+    # rather than empty strings
+
+    if x == '':
+        return None
+
+    # replace any characters that are NOT alphabets with an empty string
+    alpha = re.sub('[^a-zA-Z]+', '', x)
+
+    if alpha == '':
+        return int(x)
+    else:
+        alphabet = _SPCAT_LETTERS.get(alpha, 0)
+        if alphabet < 0:
+            # if it's negative, we need to subtract
+            return alphabet - int(x[1])
+        else:
+            # if it's positive, we need to add
+            return alphabet + int(x[1])
+
+
+# sentinels of the quantum number lookup table
+_QN_BLANK = np.iinfo(np.int16).min
+_QN_INVALID = _QN_BLANK + 1
+
+
+@functools.lru_cache(maxsize=None)
+def _qn_table():
+    '''
+    Lookup table from the two bytes of an SPCAT quantum number field
+    (packed as first_byte << 8 | second_byte) to its value, built once
+    by running _fix_spcat over every ASCII code. Blank fields map to
+    _QN_BLANK and fields _fix_spcat rejects map to _QN_INVALID.
+    '''
+    table = np.full(1 << 16, _QN_INVALID, dtype=np.int16)
+    for first in range(128):
+        for second in range(128):
+            # short lines leave trailing null padding in the record
+            field = bytes([first, second]).rstrip(b'\x00')
+            try:
+                value = _fix_spcat(field.decode().strip())
+            except (ValueError, IndexError):
+                continue
+            table[first << 8 | second] = \
+                _QN_BLANK if value is None else value
+    return table
+
+
+def _qn_codes(column):
+    '''Looks up a column of 2-byte SPCAT fields in the QN table.'''
+    pairs = np.ascontiguousarray(column).view(np.uint8).reshape(-1, 2)
+    return _qn_table()[pairs[:, 0].astype(np.intp) << 8 | pairs[:, 1]]
+
+
+def _check_qn_codes(codes):
+    '''Raises ValueError if a column of QN codes has invalid fields.'''
+    if (codes == _QN_INVALID).any():
+        raise ValueError('Invalid quantum number field in .cat file')
+
+
+def _qn_values(codes):
+    '''
+    Converts a column of QN codes into an int array, or an object array
+    holding None for blank fields, like running _fix_spcat over every
+    cell would.
+    '''
+    blank = codes == _QN_BLANK
+    if not blank.any():
+        return codes.astype(int)
+    values = codes.astype(object)
+    values[blank] = None
+    return values
+
+
+def _decode_qn_column(column):
+    '''
+    Decodes a column of 2-character SPCAT quantum number fields in bulk.
+    Returns an int array, or an object array holding None for blank
+    fields, like running _fix_spcat over every cell would.
+    '''
+    codes = _qn_codes(column)
+    _check_qn_codes(codes)
+    return _qn_values(codes)
+
+
+# A state's quantum numbers are packed into one int64 key, 10 bits per
+# quantum number biased by 512, which holds the -269..359 range of the
+# SPCAT letter codes. Blank fields pack to 0, so the 6 quantum numbers
+# of an SPCAT state fit in 60 bits.
+_QN_FIELD_BITS = 10
+_QN_FIELD_MASK = (1 << _QN_FIELD_BITS) - 1
+_QN_BIAS = 1 << (_QN_FIELD_BITS - 1)
+
+
+def _pack_qn_codes(codes):
+    '''Packs columns of QN codes, first quantum number first, into
+    int64 keys.'''
+    keys = np.zeros(len(codes[0]), dtype=np.int64)
+    for i, column in enumerate(codes):
+        fields = np.where(column == _QN_BLANK, 0,
+                          column.astype(np.int64) + _QN_BIAS)
+        keys |= fields << (_QN_FIELD_BITS * i)
+    return keys
+
+
+def _unpack_qn_keys(keys, n_qns):
+    '''Unpacks the first n_qns quantum numbers of packed keys into an
+    (n, n_qns) int array.'''
+    shifts = _QN_FIELD_BITS * np.arange(n_qns, dtype=np.int64)
+    return ((keys[:, np.newaxis] >> shifts) & _QN_FIELD_MASK) - _QN_BIAS
+
+
+def _count_qns(key):
+    '''Counts the quantum numbers packed in a key before the first
+    blank one.'''
+    n_qns = 0
+    while (int(key) >> (_QN_FIELD_BITS * n_qns)) & _QN_FIELD_MASK:
+        n_qns += 1
+    return n_qns
 
-def _make_qnstr(qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8):
-    qn_list = [qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8]
-    tmp_list = [str(x).zfill(2) for x in qn_list if x is not None]
-    return ''.join(tmp_list)
+
+def _format_qn_key(key):
+    '''
+    Formats a packed key as a quantum number string, joining every
+    quantum number zero-padded to 2 characters and skipping blank ones.
+    '''
+    fields = [(key >> (_QN_FIELD_BITS * i)) & _QN_FIELD_MASK
+              for i in range(6)]
+    return ''.join(str(field - _QN_BIAS).zfill(2)
+                   for field in fields if field)
+
+
+def _qnstr_column(keys):
+    '''Formats packed keys as quantum number strings, formatting each
+    distinct state once.'''
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return np.array([_format_qn_key(key)
+                     for key in unique_keys.tolist()])[inverse]
+
+
+# SPCAT catalog records are fixed width:
+# FORMAT(F13.4, F8.4, F8.4, I2, F10.4, I3, I7, I4, 12I2)
+_SPCAT_DTYPE = np.dtype([('frequency', 'S13'),
+                         ('freq_err', 'S8'),
+                         ('logint', 'S8'),
+                         ('dof', 'S2'),
+                         ('elow', 'S10'),
+                         ('gup', 'S3'),
+                         ('tag', 'S7'),
+                         ('qnformat', 'S4')] +
+                        [(f'qn{i}', 'S2') for i in range(1, 13)])
+
+
+def _spcat_records(raw):
+    '''
+    Splits the text of an SPCAT catalog into a structured array with
+    one bytes column per fixed-width field of the catalog format.
+    '''
+
+    if isinstance(raw, str):
+        raw = raw.encode()
+
+    # pad (or clip) every line to the record width in one go so the
+    # whole buffer can be viewed through the structured dtype
+    records = np.array(raw.splitlines(),
+                       dtype=f'S{_SPCAT_DTYPE.itemsize}')
+
+    # if there is a * in there, then the catalog was
+    # simulated too high for SPCAT format and we need to skip the line.
+    records = records[np.char.find(records, b'*') == -1]
+
+    return np.ascontiguousarray(records).view(_SPCAT_DTYPE)
+
+
+def _read_spcat_records(filein):
+    '''Reads a whole SPCAT catalog into a structured array.'''
+
+    return _spcat_records(filein.read())
+
+
+def _iter_spcat_records(filein, chunk_size):
+    '''
+    Reads an SPCAT catalog from the start in structured arrays of
+    at most chunk_size lines each.
+    '''
+
+    filein.seek(0)
+    lines = iter(filein)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        records = _spcat_records(chunk[0][:0].join(chunk))
+        # chunks made up of overflow lines only come out empty
+        if len(records):
+            yield records
 
 
 def _read_spcat(filein):
@@ -26,203 +296,41 @@ def _read_spcat(filein):
     Catalog energy units for elow are converted to K from cm-1.
     '''
 
-    # read in the catalog
-    raw_arr = _read_txt(filein)
-
-    # set up some basic lists to populate
-    frequency, freq_err, logint, dof, elow, gup, tag, qnformat, \
-        qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8, qn9, qn10, qn11, \
-        qn12 = ([] for _ in range(20))
-
-    # split everything out
-    for x in raw_arr:
-        """
-        if there is a * in there, then the catalog was
-        simulated too high for SPCAT format and we need to skip the line.
-        """
-        if '*' in x:
-            continue
-        else:
-            frequency.append(x[:13].strip())
-            freq_err.append(x[13:21].strip())
-            logint.append(x[21:29].strip())
-            dof.append(x[29:31].strip())
-            elow.append(x[31:41].strip())
-            gup.append(x[41:44].strip())
-            tag.append(x[44:51].strip())
-            qnformat.append(x[51:55].strip())
-            qn1.append(x[55:57].strip())
-            qn2.append(x[57:59].strip())
-            qn3.append(x[59:61].strip())
-            qn4.append(x[61:63].strip())
-            qn5.append(x[63:65].strip())
-            qn6.append(x[65:67].strip())
-            qn7.append(x[67:69].strip())
-            qn8.append(x[69:71].strip())
-            qn9.append(x[71:73].strip())
-            qn10.append(x[73:75].strip())
-            qn11.append(x[75:77].strip())
-            qn12.append(x[77:].strip())
-
-    # now go through and fix everything into the appropriate
-    # formats and make numpy arrays as needed
-
-    # we start with the easy ones that don't have nonsense letters
-    frequency = np.array(frequency)
-    frequency = frequency.astype(np.float64)
-    freq_err = np.array(freq_err)
-    freq_err = freq_err.astype(np.float64)
-    logint = np.array(logint)
-    logint = logint.astype(np.float64)
-    dof = np.array(dof)
-    dof = dof.astype(np.int64)
-    elow = np.array(elow)
-    elow = elow.astype(np.float64)
-    tag = np.array(tag)
-    tag = tag.astype(np.int64)
-    qnformat = np.array(qnformat)
-    qnformat = qnformat.astype(np.int64)
+    return _split_spcat(_read_spcat_records(filein), filein)
 
-    # convert elow to Kelvin
 
+def _split_spcat(records, filein):
+    '''
+    Converts structured SPCAT records into the split_cat dictionary
+    of numpy arrays read by the Catalog class.
+    '''
+
+    # the easy ones that don't have nonsense letters
+    frequency = records['frequency'].astype(np.float64)
+    freq_err = records['freq_err'].astype(np.float64)
+    logint = records['logint'].astype(np.float64)
+    dof = records['dof'].astype(np.int64)
+    elow = records['elow'].astype(np.float64)
+    tag = records['tag'].astype(np.int64)
+    qnformat = records['qnformat'].astype(np.int64)
+
+    # convert elow to Kelvin
     elow /= kcm
 
-    # now we use a sub-function to fix the letters and
-    # +/- that show up in gup, and the qns, and returns floats
-    # Edited by Jasmine to account for upper and lower case alphabets
-    # that represent positive and negative quantum numbers respectively.
-    def _fix_spcat(x):
-        '''Fixes letters in something that's read in and returns floats'''
-
-        # fix blanks - we just want them to be nice nones
-        # rather than empty strings
-
-        if x == '':
-            return None
-
-        sub_dict = {'A': 100,
-                    'B': 110,
-                    'C': 120,
-                    'D': 130,
-                    'E': 140,
-                    'F': 150,
-                    'G': 160,
-                    'H': 170,
-                    'I': 180,
-                    'J': 190,
-                    'K': 200,
-                    'L': 210,
-                    'M': 220,
-                    'N': 230,
-                    'O': 240,
-                    'P': 250,
-                    'Q': 260,
-                    'R': 270,
-                    'S': 280,
-                    'T': 290,
-                    'U': 300,
-                    'V': 310,
-                    'W': 320,
-                    'X': 330,
-                    'Y': 340,
-                    'Z': 350,
-                    'a': -10,
-                    'b': -20,
-                    'c': -30,
-                    'd': -40,
-                    'e': -50,
-                    'f': -60,
-                    'g': -70,
-                    'h': -80,
-                    'i': -90,
-                    'j': -100,
-                    'k': -110,
-                    'l': -120,
-                    'm': -130,
-                    'n': -140,
-                    'o': -150,
-                    'p': -160,
-                    'q': -170,
-                    'r': -180,
-                    's': -190,
-                    't': -200,
-                    'u': -210,
-                    'v': -220,
-                    'w': -230,
-                    'x': -240,
-                    'y': -250,
-                    'z': -260,
-                    }
-        # spinv said the minimum quantum number is -259, but I
-        # think it's a mistake, it should be able to store down to -269.
-
-        # replace any characters that are NOT alphabets with an empty string
-        alpha = re.sub('[^a-zA-Z]+', '', x)
-
-        if alpha == '':
-            return int(x)
-        else:
-            alphabet = sub_dict.get(alpha, 0)
-            if alphabet < 0:
-                # if it's negative, we need to subtract
-                return alphabet - int(x[1])
-            else:
-                # if it's positive, we need to add
-                return alphabet + int(x[1])
-
-    # run the other arrays through the fixer, then convert
-    # them to what they need to be
-
-    gup = [_fix_spcat(x) for x in gup]
-    gup = np.array(gup)
-    gup = gup.astype(int)
-    qn1 = [_fix_spcat(x) for x in qn1]
-    qn1 = np.array(qn1)
-    qn1 = qn1.astype(int) if all(y is not None for y in qn1) is True else qn1
-    qn2 = [_fix_spcat(x) for x in qn2]
-    qn2 = np.array(qn2)
-    qn2 = qn2.astype(int) if all(x is not None for x in qn2) is True else qn2
-    qn3 = [_fix_spcat(x) for x in qn3]
-    qn3 = np.array(qn3)
-    qn3 = qn3.astype(int) if all(x is not None for x in qn3) is True else qn3
-    qn4 = [_fix_spcat(x) for x in qn4]
-    qn4 = np.array(qn4)
-    qn4 = qn4.astype(int) if all(x is not None for x in qn4) is True else qn4
-    qn5 = [_fix_spcat(x) for x in qn5]
-    qn5 = np.array(qn5)
-    qn5 = qn5.astype(int) if all(x is not None for x in qn5) is True else qn5
-    qn6 = [_fix_spcat(x) for x in qn6]
-    qn6 = np.array(qn6)
-    qn6 = qn6.astype(int) if all(x is not None for x in qn6) is True else qn6
-    qn7 = [_fix_spcat(x) for x in qn7]
-    qn7 = np.array(qn7)
-    qn7 = qn7.astype(int) if all(x is not None for x in qn7) is True else qn7
-    qn8 = [_fix_spcat(x) for x in qn8]
-    qn8 = np.array(qn8)
-    qn8 = qn8.astype(int) if all(x is not None for x in qn8) is True else qn8
-    qn9 = [_fix_spcat(x) for x in qn9]
-    qn9 = np.array(qn9)
-    qn9 = qn9.astype(int) if all(x is not None for x in qn9) is True else qn9
-    qn10 = [_fix_spcat(x) for x in qn10]
-    qn10 = np.array(qn10)
-    qn10 = qn10.astype(int) if all(
-        x is not None for x in qn10) is True else qn10
-    qn11 = [_fix_spcat(x) for x in qn11]
-    qn11 = np.array(qn11)
-    qn11 = qn11.astype(int) if all(
-        x is not None for x in qn11) is True else qn11
-    qn12 = [_fix_spcat(x) for x in qn12]
-    qn12 = np.array(qn12)
-    qn12 = qn12.astype(int) if all(
-        x is not None for x in qn12) is True else qn12
-
-    # make the qnstrings
-    qn_list_up = [_make_qnstr(qn1, qn2, qn3, qn4, qn5, qn6, None, None)
-                  for qn1, qn2, qn3, qn4, qn5, qn6 in zip(
-                      qn1, qn2, qn3, qn4, qn5, qn6)]
-    qn_list_low = [_make_qnstr(qn7, qn8, qn9, qn10, qn11, qn12, None, None)
-                   for qn7, qn8, qn9, qn10, qn11, qn12 in zip(
-                       qn7, qn8, qn9, qn10, qn11, qn12)]
+    # gup only carries letters past 999 degeneracy, so fall back to
+    # the per-cell fixer just for those catalogs
+    try:
+        gup = records['gup'].astype(int)
+    except ValueError:
+        gup = np.array([_fix_spcat(x.decode().strip())
+                        for x in records['gup']]).astype(int)
+    codes = [_qn_codes(records[f'qn{i}']) for i in range(1, 13)]
+    for column in codes:
+        _check_qn_codes(column)
+    qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8, qn9, qn10, qn11, qn12 = [
+        _qn_values(column) for column in codes]
+    qnup_key = _pack_qn_codes(codes[:6])
+    qnlow_key = _pack_qn_codes(codes[6:])
 
     split_cat = {
         'frequency': 	frequency,
@@ -241,7 +349,8 @@ def _read_spcat(filein):
         'qn6up':	qn6,
         'qn7up':	np.full(len(frequency), None),
         'qn8up':	np.full(len(frequency), None),
-        'qnup_str':	np.array(qn_list_up),
+        'qnup_str':	_qnstr_column(qnup_key),
+        'qnup_key':	qnup_key,
         'qn1low':	qn7,
         'qn2low':	qn8,
         'qn3low':	qn9,
@@ -250,227 +359,176 @@ def _read_spcat(filein):
         'qn6low':	qn12,
         'qn7low':	np.full(len(frequency), None),
         'qn8low':	np.full(len(frequency), None),
-        'qnlow_str':	np.array(qn_list_low),
+        'qnlow_str':	_qnstr_column(qnlow_key),
+        'qnlow_key':	qnlow_key,
         'notes':	f'Loaded from file {filein}'
     }
 
     return split_cat
 
 
-def _load_catalog(filein):
-    '''
-    Reads in a catalog file of the specified type and returns a catalog
-    object. Optionally accepts a catdict dictionary to preload the
-    catalog object with additional information. Defaults to loading
-    an spcat catalog.
-
-    Anything in catdict will overwrite what's loaded in from the
-    read catalog function, so use cautiously.
-    '''
-
-    new_dict = _read_spcat(filein)  # read in the catalog file and produce the
-    # dictionary
-
-    cat = Catalog(catdict=new_dict)  # make the catalog and return it
-
-    return cat
-
-
-def _make_level_dict(qn1low, qn2low, qn3low, qn4low, qn5low,
-                     qn6low, qn7low, qn8low, qn1up, qn2up,
-                     qn3up, qn4up, qn5up, qn6up, qn7up, qn8up,
-                     frequency, elow, gup, qn_list_low, qn_list_up,
-                     level_qns, level_dict, qnstrfmt=None):
-
-    # we need to sort out unique levels from our catalog.
-    # Those will have unique quantum numbers. When we find
-    # a match to a lower level, add the info in.
-    for x in range(len(frequency)):
-        qnstr_low = qn_list_low[x]
-        level_dict[qnstr_low] = {'energy':	elow[x],
-                                 'g':	None,
-                                 'g_flag':	False,
-                                 'qn1':	qn1low[x] if qn1low is not None
-                                 else None,
-                                 'qn2':	qn2low[x] if qn2low is not None
-                                 else None,
-                                 'qn3':	qn3low[x] if qn3low is not None
-                                 else None,
-                                 'qn4':	qn4low[x] if qn4low is not None
-                                 else None,
-                                 'qn5':	qn5low[x] if qn5low is not None
-                                 else None,
-                                 'qn6':	qn6low[x] if qn6low is not None
-                                 else None,
-                                 'qn7':	qn7low[x] if qn7low is not None
-                                 else None,
-                                 'qn8':	qn8low[x] if qn8low is not None
-                                 else None,
-                                 'id':	qn_list_low[x],
-                                 'qnstrfmt':	qnstrfmt,
-                                 }
-
-    # do it again to fill in energy levels that were
-    # upper states and didn't get hit
-    for x in range(len(frequency)):
-        qnstr_up = qn_list_up[x]
-        if level_dict[qnstr_up] is None:
-            # calculate the energy.  Move the transition from MHz -> cm-1 -> K
-            freq_cm = (frequency[x]*1E6/ccm)
-            freq_K = freq_cm / kcm
-            level_dict[qnstr_up] = {'energy':	elow[x] + freq_K,
-                                    'g':	gup[x],
-                                    'g_flag':	False,
-                                    'qn1':	qn1up[x] if qn1up is not None
-                                    else None,
-                                    'qn2':	qn2up[x] if qn2up is not None
-                                    else None,
-                                    'qn3':	qn3up[x] if qn3up is not None
-                                    else None,
-                                    'qn4':	qn4up[x] if qn4up is not None
-                                    else None,
-                                    'qn5':	qn5up[x] if qn5up is not None
-                                    else None,
-                                    'qn6':	qn6up[x] if qn6up is not None
-                                    else None,
-                                    'qn7':	qn7up[x] if qn7up is not None
-                                    else None,
-                                    'qn8':	qn8up[x] if qn8up is not None
-                                    else None,
-                                    'id':	qn_list_up[x],
-                                    'qnstrfmt':	qnstrfmt,
-                                    }
-
-    # go grab the degeneracies
-    for x in range(len(frequency)):
-        qnstr_up = qn_list_up[x]
-        if level_dict[qnstr_up]['g'] is None:
-            level_dict[qnstr_up]['g'] = gup[x]
-
-    # now go through and fill any degeneracies that didn't
-    # get hit (probably ground states)
-    # assume it's just 2J+1.  Set the flag for a
-    # calculated degeneracy to True.
-    for x in level_dict:
-        if level_dict[x]['g'] is None:
-            level_dict[x]['g'] = 2*level_dict[x]['qn1'] + 1
-            level_dict[x]['g_flag'] = True
-
-    return level_dict
-
-
 def parse_cat(filein, qn_label_list, qnstrfmt=None, partition_dict=None,
-              qpart_file=None):
+              qpart_file=None, partition_function=None, qn_json=False):
     '''
     Loads a molecule in from a catalog file.  Default catalog
     type is molsim.  Override things with catdict.  Generates
     energy level objects, transition objects, a partition
     function object and	a molecule object which it returns.
+    A compiled partition_function, such as one cached by
+    data.partition, is used as is instead of building one from
+    partition_dict or qpart_file. With qn_json, the quantum numbers
+    are encoded as JSON column by column instead of built into
+    dictionaries row by row, for writers that send them as text.
     '''
 
     # load the catalog in
-    cat = _load_catalog(filein)
-
-    # now we have to make a hash for every entries upper and
-    # lower state.  If this already exists in the catalog, great.
-    # If not, we have to make it.
-    if cat.qnup_str is None:
-        qn_list_up = [_make_qnstr(
-            qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8)
-            for qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8 in zip(
-            cat.qn1up, cat.qn2up, cat.qn3up, cat.qn4up,
-            cat.qn5up, cat.qn6up, cat.qn7up, cat.qn8up)]
-    else:
-        qn_list_up = cat.qnup_str
+    split_cat = _read_spcat(filein)
+    cat = Catalog(catdict=split_cat)
+
+    # now we find the unique energy levels from the packed quantum
+    # numbers of every entry's upper and lower state and update the
+    # catalog with the eup and glow they give
+    level_table = _make_level_table(
+        split_cat['qnlow_key'], split_cat['qnup_key'], cat.frequency,
+        cat.elow, cat.gup)
+    cat.glow, cat.eup = _lookup_levels(
+        level_table, split_cat['qnlow_key'], split_cat['qnup_key'])
+
+    # now we have to load the transitions in and make transition objects
+
+    # make a partition function object unless a compiled one is given
+    qpart = partition_function
+    if qpart is None:
+        qpart = _make_partition_function(partition_dict, qpart_file)
 
-    if cat.qnlow_str is None:
-        qn_list_low = [_make_qnstr(qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8)
-                       for qn1, qn2, qn3, qn4, qn5, qn6, qn7, qn8 in zip(
-            cat.qn1low, cat.qn2low, cat.qn3low, cat.qn4low, cat.qn5low,
-            cat.qn6low, cat.qn7low, cat.qn8low)]
+    # set sijmu and aij
+    cat._set_sijmu_aij(qpart)
+
+    return _make_parsed_cat(cat, split_cat, qn_label_list, qn_json)
+
+
+def _make_parsed_cat(cat, split_cat, qn_label_list, qn_json):
+    '''Collects the arrays of a catalog and the quantum numbers of its
+    split catalog into a ParsedCat.'''
+
+    _check_qn_labels(split_cat, qn_label_list)
+    if qn_json:
+        qn_dict_lists = None, None
+        qn_json_columns = _make_qn_json_columns(split_cat, qn_label_list)
     else:
-        qn_list_low = cat.qnlow_str
-
-    level_qns = np.concatenate((qn_list_low, qn_list_up), axis=0)
-    level_qns = list(set(list(level_qns)))  # get the unique ones
-    level_dict = dict.fromkeys(level_qns)
-
-    # now we find unique energy levels.  We just get the dictionary
-    # of levels, since that function is computationally intensive
-    # and we want to njit it.
-
-    level_dict = _make_level_dict(
-        cat.qn1low,
-        cat.qn2low,
-        cat.qn3low,
-        cat.qn4low,
-        cat.qn5low,
-        cat.qn6low,
-        cat.qn7low,
-        cat.qn8low,
-        cat.qn1up,
-        cat.qn2up,
-        cat.qn3up,
-        cat.qn4up,
-        cat.qn5up,
-        cat.qn6up,
-        cat.qn7up,
-        cat.qn8up,
-        cat.frequency,
-        cat.elow,
-        cat.gup,
-        qn_list_low,
-        qn_list_up,
-        level_qns,
-        level_dict,
-        qnstrfmt,
-    )
+        qn_dict_lists = _make_qn_dict_lists(split_cat, qn_label_list)
+        qn_json_columns = None, None
+    n_qns = len(qn_label_list)
+    return ParsedCat(cat.frequency, cat.freq_err, cat.logint, cat.sijmu,
+                     cat.aij, cat.elow, cat.eup, cat.glow, cat.gup,
+                     cat.qnformat, cat.qnlow_str, cat.qnup_str,
+                     *qn_dict_lists, *qn_json_columns,
+                     _unpack_qn_keys(split_cat['qnlow_key'], n_qns),
+                     _unpack_qn_keys(split_cat['qnup_key'], n_qns),
+                     list(qn_label_list))
 
-    # load those levels into level objects and add to a list
-    levels = []
-    for x in level_dict:
-        levels.append(Level(
-            energy=level_dict[x]['energy'],
-            g=level_dict[x]['g'],
-            g_flag=level_dict[x]['g_flag'],
-            qn1=level_dict[x]['qn1'],
-            qn2=level_dict[x]['qn2'],
-            qn3=level_dict[x]['qn3'],
-            qn4=level_dict[x]['qn4'],
-            qn5=level_dict[x]['qn5'],
-            qn6=level_dict[x]['qn6'],
-            qn7=level_dict[x]['qn7'],
-            qn8=level_dict[x]['qn8'],
-            qnstrfmt=level_dict[x]['qnstrfmt'],
-            id=level_dict[x]['id']
-        ))
-    # sort them so the lowest energy is first
-    levels.sort(key=lambda x: x.energy)
-
-    # we'll now update the catalog with some of the things we've
-    # calculated like eup and glow unless they're already present
-    tmp_dict = {}
-    for x in levels:
-        tmp_dict[x.id] = [x.g, x.energy]
-    if cat.glow is None:
-        cat.glow = np.empty_like(cat.frequency)
-    if cat.eup is None:
-        cat.eup = np.empty_like(cat.frequency)
-    for x in range(len(cat.frequency)):
-        cat.glow[x] = tmp_dict[cat.qnlow_str[x]][0]
-        cat.eup[x] = tmp_dict[cat.qnup_str[x]][1]
 
-    # now we have to load the transitions in and make transition objects
+def _first_occurrences(index):
+    '''Returns the unique values of an index array and the position of
+    the first occurrence of each.'''
+    return np.unique(index, return_index=True)
+
+
+def _last_occurrences(index):
+    '''Returns the unique values of an index array and the position of
+    the last occurrence of each.'''
+    unique, reversed_position = np.unique(index[::-1], return_index=True)
+    return unique, len(index) - 1 - reversed_position
+
+
+def _make_level_table(qnlow_key, qnup_key, frequency, elow, gup):
+    '''
+    Finds the unique energy levels of a catalog from the packed quantum
+    numbers of its transitions. A level seen as a lower state takes the
+    lower state energy of its last transition, a level only seen as an
+    upper state takes its energy from its first transition, and
+    degeneracies come from the first transition reaching a level,
+    falling back to 2J+1 for levels never reached (probably ground
+    states). Returns the sorted level keys with their energies and
+    degeneracies.
+    '''
+
+    n_lines = len(frequency)
+    level_keys, level_index = np.unique(
+        np.concatenate((qnlow_key, qnup_key)), return_inverse=True)
+    low_index, up_index = level_index[:n_lines], level_index[n_lines:]
+    energy = np.empty(len(level_keys))
+    g = np.full(len(level_keys), np.nan)
+
+    # Move the transition from MHz -> cm-1 -> K
+    freq_cm = (np.asarray(frequency)*1E6/ccm)
+    freq_K = freq_cm / kcm
+    up_levels, first_up = _first_occurrences(up_index)
+    energy[up_levels] = elow[first_up] + freq_K[first_up]
+    g[up_levels] = gup[first_up]
+
+    low_levels, last_low = _last_occurrences(low_index)
+    energy[low_levels] = elow[last_low]
+    not_reached = low_levels[np.isnan(g[low_levels])]
+    qn1 = _unpack_qn_keys(level_keys[not_reached], 1)[:, 0]
+    g[not_reached] = 2*qn1 + 1
+
+    return level_keys, energy, g
+
+
+def _lookup_levels(level_table, qnlow_key, qnup_key):
+    '''Returns glow and eup of transitions from a level table made by
+    _make_level_table.'''
+
+    level_keys, energy, g = level_table
+    glow = g[np.searchsorted(level_keys, qnlow_key)]
+    eup = energy[np.searchsorted(level_keys, qnup_key)]
+    return glow, eup
+
+
+def iter_parse_cat(filein, qn_label_list, chunk_size, partition_dict=None,
+                   qpart_file=None, partition_function=None, qn_json=False):
+    '''
+    Chunked variant of parse_cat for large catalogs. The catalog is read
+    twice in chunks of chunk_size lines: once to collect the columns
+    the energy levels are found from, then again to yield a ParsedCat
+    for every chunk, so only one chunk of transitions is held in
+    memory at a time.
+    '''
+
+    qpart = partition_function
+    if qpart is None:
+        qpart = _make_partition_function(partition_dict, qpart_file)
+    level_columns = [[] for _ in range(5)]
+    for records in _iter_spcat_records(filein, chunk_size):
+        split_cat = _split_spcat(records, filein)
+        for column, key in zip(level_columns, [
+                'qnlow_key', 'qnup_key', 'frequency', 'elow', 'gup']):
+            column.append(split_cat[key])
+    level_table = _make_level_table(
+        *[np.concatenate(column) for column in level_columns])
+
+    for records in _iter_spcat_records(filein, chunk_size):
+        split_cat = _split_spcat(records, filein)
+        cat = Catalog(catdict=split_cat)
+        cat.glow, cat.eup = _lookup_levels(
+            level_table, split_cat['qnlow_key'], split_cat['qnup_key'])
+        cat._set_sijmu_aij(qpart)
+
+        yield _make_parsed_cat(cat, split_cat, qn_label_list, qn_json)
+
+
+def _make_partition_function(partition_dict=None, qpart_file=None):
+    '''Makes the partition function object of a catalog.'''
 
-    # make a partition function object and assign it to the molecule
     # if there's no other info, assume we're state counting
     if partition_dict is None:
         partition_dict = {}
     # if there's a qpart file specified, read that in
     if qpart_file is not None:
         partition_dict['qpart_file'] = qpart_file
-    # make the partition function object and assign it
-    qpart = PartitionFunction(
+    # make the partition function object and return it
+    return PartitionFunction(
         qpart_file=partition_dict['qpart_file'] if 'qpart_file' in
         partition_dict else None,
         form=partition_dict['form'] if 'form' in partition_dict
@@ -492,30 +550,58 @@ def parse_cat(filein, qn_label_list, qnstrfmt=None, partition_dict=None,
         notes=partition_dict['notes'] if 'notes' in partition_dict else None,
     )
 
-    # set sijmu and aij
-    cat._set_sijmu_aij(qpart)
-    if len(qn_label_list) != len(cat.qnlow_str[0])/2 or \
-            len(qn_label_list) != len(cat.qnup_str[0])/2:
+
+def _check_qn_labels(split_cat, qn_label_list):
+    '''Checks there is a quantum number label for every quantum number
+    of a split catalog.'''
+
+    if len(qn_label_list) != _count_qns(split_cat['qnlow_key'][0]) or \
+            len(qn_label_list) != _count_qns(split_cat['qnup_key'][0]):
         raise ValueError(
             'Quantum number labels do not match the number of \
             quantum numbers in .cat file')
-    lower_state_qn_dict_list = []
-    upper_state_qn_dict_list = []
 
-    # Reformat lower and upper quantum state number strings into dictionaries
+
+def _make_qn_dict_lists(split_cat, qn_label_list):
+    '''
+    Unpacks the lower and upper state quantum numbers of a split
+    catalog into dictionaries keyed by the quantum number labels.
+    '''
+
+    n_qns = len(qn_label_list)
+
     # The dictionaries are appended to lists.
-    for i in range(len(cat.frequency)):
-        lower_state_qn_dict = {}
-        upper_state_qn_dict = {}
-        j = 0
-        for qn_label in qn_label_list:
-            lower_state_qn_dict[qn_label] = int(cat.qnlow_str[i][j:j+2])
-            upper_state_qn_dict[qn_label] = int(cat.qnup_str[i][j:j+2])
-            j += 2
-        lower_state_qn_dict_list.append(lower_state_qn_dict)
-        upper_state_qn_dict_list.append(upper_state_qn_dict)
-
-    return cat.frequency, cat.freq_err, cat.logint, cat.sijmu, \
-        cat.aij, cat.elow, cat.eup, cat.glow, cat.gup, cat.qnformat, \
-        cat.qnlow_str, cat.qnup_str, lower_state_qn_dict_list, \
-        upper_state_qn_dict_list
+    lower_state_qn_dict_list = [
+        dict(zip(qn_label_list, qns)) for qns in
+        _unpack_qn_keys(split_cat['qnlow_key'], n_qns).tolist()]
+    upper_state_qn_dict_list = [
+        dict(zip(qn_label_list, qns)) for qns in
+        _unpack_qn_keys(split_cat['qnup_key'], n_qns).tolist()]
+
+    return lower_state_qn_dict_list, upper_state_qn_dict_list
+
+
+def _qn_json_column(keys, qn_label_list):
+    '''
+    Encodes the quantum number dictionaries of packed keys as JSON text,
+    the same as json.dumps of the dictionaries _make_qn_dict_lists
+    makes, encoding each distinct state once. Returns an object array
+    of str.
+    '''
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    encoded = np.array([
+        json.dumps(dict(zip(qn_label_list, qns))) for qns in
+        _unpack_qn_keys(unique_keys, len(qn_label_list)).tolist()],
+        dtype=object)
+    return encoded[inverse]
+
+
+def _make_qn_json_columns(split_cat, qn_label_list):
+    '''
+    Columnar counterpart of _make_qn_dict_lists giving the lower and
+    upper state quantum number dictionaries as pre-encoded JSON, for
+    writers that send the JSONB fields as text.
+    '''
+
+    return (_qn_json_column(split_cat['qnlow_key'], qn_label_list),
+            _qn_json_column(split_cat['qnup_key'], qn_label_list))
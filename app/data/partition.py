@@ -0,0 +1,42 @@
+"""
+Cache of the partition functions of species metadata.
+"""
+import functools
+import json
+
+import numpy as np
+from django.conf import settings
+
+from data.parse_line import _make_partition_function
+
+
+@functools.lru_cache(maxsize=settings.PARTITION_FUNCTION_CACHE_SIZE)
+def _compiled_partition_function(meta_id, qpart_file_name, points):
+    '''Builds the interpolating partition function of a metadata.'''
+    temps, vals = zip(*points)
+    return _make_partition_function({
+        'form': 'interpolation',
+        'temps': np.array(temps),
+        'vals': np.array(vals)})
+
+
+def get_partition_function(meta):
+    '''
+    Returns the partition function of a species metadata, built from the
+    (temperature, Q) pairs stored in its partition_function field when
+    the .qpart file was uploaded, so the file itself is never read.
+    Compiled partition functions are kept in an LRU cache keyed by the
+    metadata id and qpart file name, along with the stored pairs so
+    that editing them misses the cache too.
+    '''
+    partition_dict = meta.partition_function
+    if isinstance(partition_dict, str):
+        partition_dict = json.loads(partition_dict)
+    points = tuple((float(temp), float(val))
+                   for temp, val in partition_dict.items())
+    return _compiled_partition_function(
+        meta.pk, meta.qpart_file.name, points)
+
+
+cache_info = _compiled_partition_function.cache_info
+cache_clear = _compiled_partition_function.cache_clear
@@ -0,0 +1,86 @@
+"""
+Raw SQL queries of lines and species.
+"""
+import json
+
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Value
+from rdkit import DataStructs
+
+from core.models import Line, Linelist, Species, SpeciesMetadata
+
+# Similarity lookups on the fingerprint index, with the cartridge
+# setting of their threshold and the function of their similarity.
+SIMILARITY_METRICS = {
+    'tanimoto': ('rdkit.tanimoto_threshold', 'tanimoto_sml'),
+    'dice': ('rdkit.dice_threshold', 'dice_sml'),
+}
+
+# Columns selected for every line, in the order of
+# serializers.QueryValuesSerializer.keys.
+_WINDOW_COLUMNS = [
+    'l.frequency', 'l.measured', 'l.uncertainty', 'l.intensity',
+    'l.lower_state_qn', 'l.upper_state_qn', 'l.lower_state_energy',
+    'l.upper_state_energy', 'l.s_ij', 'l.s_ij_mu2', 'l.a_ij',
+    'l.rovibrational', 's.name_formula', 's.iupac_name', 's.name',
+    'm.molecule_tag', 'm.hyperfine', 'll.linelist_name', 'l.meta_id',
+    's.smiles', 's.selfies']
+_JSON_COLUMNS = [_WINDOW_COLUMNS.index(column) for column in
+                 ['l.lower_state_qn', 'l.upper_state_qn', 's.name']]
+
+
+def query_windows(windows):
+    '''
+    Queries the lines of many (min_freq, max_freq) frequency windows in
+    one round trip. The window bounds are unnested into a relation and
+    joined against the float8 frequency index. Returns one list of rows
+    per window, in the order of windows, with the columns of
+    QueryValuesSerializer.
+    '''
+    quote_name = connection.ops.quote_name
+    sql = (
+        f'SELECT w.ord, {", ".join(_WINDOW_COLUMNS)} '
+        f'FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY '
+        f'AS w(min_freq, max_freq, ord) '
+        f'JOIN {quote_name(Line._meta.db_table)} l '
+        f'ON l.frequency::float8 BETWEEN w.min_freq AND w.max_freq '
+        f'JOIN {quote_name(SpeciesMetadata._meta.db_table)} m '
+        f'ON m.id = l.meta_id '
+        f'JOIN {quote_name(Species._meta.db_table)} s '
+        f'ON s.id = m.species_id '
+        f'JOIN {quote_name(Linelist._meta.db_table)} ll '
+        f'ON ll.id = m.linelist_id '
+        f'ORDER BY w.ord, l.frequency::float8, l.id')
+    results = [[] for _ in windows]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [[window[0] for window in windows],
+                             [window[1] for window in windows]])
+        for window_number, *row in cursor:
+            # Django leaves jsonb columns of raw queries undecoded.
+            for i in _JSON_COLUMNS:
+                if isinstance(row[i], str):
+                    row[i] = json.loads(row[i])
+            results[window_number - 1].append(row)
+    return results
+
+
+def similar_species(fingerprint, threshold, top_k, metric='tanimoto'):
+    '''
+    Returns up to top_k (species, similarity) pairs of the species whose
+    Morgan fingerprint is at least threshold similar to fingerprint, most
+    similar first. The threshold is set for the transaction with SET
+    LOCAL so that the % (tanimoto) or # (dice) operator of the RDKit
+    cartridge screens the species through the GiST index of morgan_fp.
+    '''
+    setting, function = SIMILARITY_METRICS[metric]
+    query_fp = Func(Value(DataStructs.BitVectToBinaryText(fingerprint)),
+                    function='bfp_from_binary_text',
+                    output_field=Species._meta.get_field('morgan_fp'))
+    queryset = Species.objects.filter(**{f'morgan_fp__{metric}': query_fp}) \
+        .annotate(similarity=Func(F('morgan_fp'), query_fp,
+                                  function=function,
+                                  output_field=FloatField())) \
+        .order_by('-similarity', 'id')[:top_k]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SET LOCAL {setting} = %s', [threshold])
+        return [(species, species.similarity) for species in queryset]
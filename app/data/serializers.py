@@ -1,10 +1,13 @@
 """
 Serializers for data APIs.
 """
+from django.conf import settings
+from rdkit import Chem
 from rest_framework import serializers
 
 from core.models import (Species, Linelist, SpeciesMetadata,
                          Reference, MetaReference, Line)
+from data import chem_cache
 
 
 class LinelistSerializer(serializers.ModelSerializer):
@@ -46,13 +49,22 @@ class SpeciesSerializer(serializers.ModelSerializer):
     """Serializer for species."""
     molecular_mass = serializers.DecimalField(
         max_digits=None, decimal_places=None, read_only=True)
+    image_url = serializers.CharField(read_only=True)
 
     class Meta:
         model = Species
         fields = ['id', 'name', 'iupac_name', 'name_formula',
                   'name_html', 'molecular_mass', 'smiles',
-                  'standard_inchi', 'standard_inchi_key', 'selfies', 'notes']
-        read_only_fields = ['id', 'molecular_mass', 'selfies']
+                  'standard_inchi', 'standard_inchi_key', 'selfies', 'notes',
+                  'image_url']
+        read_only_fields = ['id', 'molecular_mass', 'selfies', 'image_url']
+
+
+class SpeciesBulkSerializer(SpeciesSerializer):
+    """Serializer for rows of bulk species creation, whose IUPAC names
+    are checked for uniqueness all at once."""
+    class Meta(SpeciesSerializer.Meta):
+        extra_kwargs = {'iupac_name': {'validators': []}}
 
 
 class SpeciesChangeSerializer(SpeciesSerializer):
@@ -64,6 +76,30 @@ class SpeciesChangeSerializer(SpeciesSerializer):
         fields = SpeciesSerializer.Meta.fields + ['_change_reason', 'mol_obj']
         read_only_fields = ['id']
 
+    def validate_smiles(self, value):
+        """Canonicalize the smiles, like creating a species does."""
+        canonical_smiles = chem_cache.canonical_smiles(value)
+        if canonical_smiles is None:
+            raise serializers.ValidationError(f'Invalid SMILES {value!r}.')
+        return canonical_smiles
+
+    def validate(self, attrs):
+        """Check an rdkit mol object sent with new smiles is the same
+        molecule."""
+        smiles = attrs.get('smiles')
+        mol_obj = attrs.get('mol_obj')
+        if smiles is None or mol_obj is None:
+            return attrs
+        if isinstance(mol_obj, str):
+            mol_smiles = chem_cache.canonical_smiles(mol_obj)
+        else:
+            mol_smiles = Chem.MolToSmiles(mol_obj)
+        if mol_smiles != smiles:
+            raise serializers.ValidationError(
+                {'mol_obj': ['The rdkit mol object does not match the '
+                             'smiles.']})
+        return attrs
+
 
 class SpeciesMetadataSerializer(serializers.ModelSerializer):
     """Serializer for species metadata."""
@@ -139,6 +175,13 @@ class LineSerializer(serializers.ModelSerializer):
     cat_file = serializers.FileField(write_only=True)
     qn_label_str = serializers.CharField(write_only=True)
     contains_rovibrational = serializers.BooleanField(write_only=True)
+    chunk_size = serializers.IntegerField(
+        write_only=True, required=False, min_value=1)
+    ingest_method = serializers.ChoiceField(
+        choices=['serializer', 'bulk', 'copy'], default='serializer',
+        write_only=True)
+    _change_reason = serializers.CharField(
+        max_length=255, write_only=True, required=False)
 
     class Meta:
         model = Line
@@ -148,6 +191,7 @@ class LineSerializer(serializers.ModelSerializer):
                   'lower_state_energy', 'upper_state_degeneracy',
                   'lower_state_degeneracy', 'upper_state_qn',
                   'lower_state_qn', 'contains_rovibrational',
+                  'chunk_size', 'ingest_method', '_change_reason',
                   'rovibrational', 'vib_qn', 'pickett_qn_code',
                   'pickett_upper_state_qn', 'pickett_lower_state_qn',
                   'notes']
@@ -237,3 +281,77 @@ class QuerySerializer(serializers.ModelSerializer):
         representation['smiles'] = instance.meta.species.smiles
         representation['selfies'] = instance.meta.species.selfies
         return representation
+
+
+class QueryValuesSerializer(serializers.BaseSerializer):
+    """Read-only serializer for querying lines that gives the same
+    output as QuerySerializer from values_list() rows, without
+    instantiating Line, SpeciesMetadata, Species and Linelist objects
+    for every line."""
+    # Output keys and the lookups they are read from, in the order of
+    # QuerySerializer. The line id ends the lookups for keyset
+    # pagination and is left out of the output.
+    keys = ['frequency', 'measured', 'uncertainty', 'intensity',
+            'lower_state_qn', 'upper_state_qn', 'lower_state_energy',
+            'upper_state_energy', 's_ij', 's_ij_mu2', 'a_ij',
+            'rovibrational', 'name_formula', 'iupac_name', 'name',
+            'molecule_tag', 'hyperfine', 'linelist', 'meta_id', 'smiles',
+            'selfies']
+    lookups = ['frequency', 'measured', 'uncertainty', 'intensity',
+               'lower_state_qn', 'upper_state_qn', 'lower_state_energy',
+               'upper_state_energy', 's_ij', 's_ij_mu2', 'a_ij',
+               'rovibrational', 'meta__species__name_formula',
+               'meta__species__iupac_name', 'meta__species__name',
+               'meta__molecule_tag', 'meta__hyperfine',
+               'meta__linelist__linelist_name', 'meta_id',
+               'meta__species__smiles', 'meta__species__selfies', 'id']
+    decimal_keys = ['frequency', 'uncertainty', 'intensity',
+                    'lower_state_energy', 'upper_state_energy', 's_ij',
+                    's_ij_mu2', 'a_ij']
+
+    @classmethod
+    def project(cls, queryset):
+        """Return the rows of a line queryset this serializer reads."""
+        return queryset.values_list(*cls.lookups, named=True)
+
+    def to_representation(self, row):
+        representation = dict(zip(self.keys, row))
+        for key in self.decimal_keys:
+            value = representation[key]
+            if value is not None:
+                representation[key] = '{:f}'.format(value)
+        return representation
+
+
+class QueryWindowSerializer(serializers.Serializer):
+    """Serializer for a frequency window of a batch line query, given
+    as center and tolerance or as min_freq and max_freq."""
+    center = serializers.FloatField(required=False)
+    tolerance = serializers.FloatField(required=False, min_value=0)
+    min_freq = serializers.FloatField(required=False)
+    max_freq = serializers.FloatField(required=False)
+
+    def validate(self, attrs):
+        """Resolve the window into min_freq and max_freq."""
+        if set(attrs) == {'center', 'tolerance'}:
+            return {'min_freq': attrs['center'] - attrs['tolerance'],
+                    'max_freq': attrs['center'] + attrs['tolerance']}
+        if set(attrs) == {'min_freq', 'max_freq'}:
+            if attrs['min_freq'] > attrs['max_freq']:
+                raise serializers.ValidationError(
+                    'min_freq must not be greater than max_freq.')
+            return attrs
+        raise serializers.ValidationError(
+            'Give either center and tolerance or min_freq and max_freq.')
+
+
+class QueryWindowsSerializer(serializers.Serializer):
+    """Serializer for querying lines in many frequency windows."""
+    windows = QueryWindowSerializer(many=True, allow_empty=False)
+
+    def validate_windows(self, value):
+        if len(value) > settings.LINE_QUERY_MAX_WINDOWS:
+            raise serializers.ValidationError(
+                f'Ensure there are no more than '
+                f'{settings.LINE_QUERY_MAX_WINDOWS} windows.')
+        return value
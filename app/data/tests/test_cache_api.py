@@ -0,0 +1,168 @@
+"""
+Tests for the response cache of data APIs.
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Linelist, Line
+from data import cache as response_cache
+from data.tests.test_line_api import (create_species, create_linelist,
+                                      create_meta, create_line)
+
+LINELIST_URL = reverse('data:linelist-list')
+
+
+class ResponseCacheTests(TestCase):
+    """Test caching the responses of read-only requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_repeated_request_hits_cache(self):
+        """Test a repeated request with reordered query parameters is
+        served from the cache without querying the database."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL + '?a=1&b=2')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            cached = self.client.get(LINELIST_URL + '?b=2&a=1')
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached['ETag'], res['ETag'])
+
+    @override_settings(DATA_RESPONSE_CACHE_MAX_BYTES=10)
+    def test_large_response_not_cached(self):
+        """Test responses above the size limit are not cached, but can
+        still be revalidated."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL)
+        self.assertGreater(len(res.content), 10)
+        self.assertIsNone(cache.get(f'data:response:{res["ETag"][1:-1]}'))
+        res_etag = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_etag.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_revalidate_not_modified(self):
+        """Test revalidating with If-None-Match or If-Modified-Since gives
+        a 304."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL)
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+        res_etag = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_etag.status_code, status.HTTP_304_NOT_MODIFIED)
+        res_date = self.client.get(
+            LINELIST_URL, HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res_date.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_save_invalidates(self):
+        """Test saving a model invalidates the responses read from
+        it."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL)
+        Linelist.objects.create(linelist_name='Other Linelist')
+        res_new = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_new.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res_new['ETag'], res['ETag'])
+        self.assertEqual(len(res_new.json()), 2)
+
+    def test_delete_invalidates(self):
+        """Test deleting a model invalidates the responses read from
+        it."""
+        linelist = Linelist.objects.create(linelist_name='Test Linelist')
+        self.client.get(LINELIST_URL)
+        linelist.delete()
+        self.assertEqual(self.client.get(LINELIST_URL).json(), [])
+
+    def test_invalidate_other_model_keeps_cache(self):
+        """Test invalidating a model the endpoint does not read keeps
+        its cached responses."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL)
+        response_cache.invalidate(Line)
+        res_again = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_again.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_errors_not_cached(self):
+        """Test error responses are not cached."""
+        url = reverse('data:line-query')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('ETag', res)
+
+    def test_etag_from_history_versions(self):
+        """Test the ETag comes from the history tables, so it survives
+        clearing the cache."""
+        Linelist.objects.create(linelist_name='Test Linelist')
+        res = self.client.get(LINELIST_URL)
+        cache.clear()
+        res_again = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_again.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(DATA_RESPONSE_VERSION_TIMEOUT=0)
+    def test_write_of_other_worker_expires_versions(self):
+        """Test a write whose invalidation runs against the cache of
+        another worker changes the ETag once the versions expire."""
+        res = self.client.get(LINELIST_URL)
+        with patch('data.cache._forget_versions'):
+            Linelist.objects.create(linelist_name='Test Linelist')
+        res_new = self.client.get(
+            LINELIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_new.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res_new.json()), 1)
+
+    def test_line_query_meta_versions(self):
+        """Test line queries limited to a species metadata only change
+        with the lines of that metadata."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        other_meta = create_meta(species.id, linelist.id, molecule_tag=2)
+        create_line(meta.id, frequency=100.000)
+        url = reverse('data:line-query')
+        params = {'min_freq': '99.000', 'meta': meta.id}
+        res = self.client.get(url, params)
+        create_line(other_meta.id, frequency=200.000)
+        res_other = self.client.get(
+            url, params, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_other.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        create_line(meta.id, frequency=300.000)
+        res_new = self.client.get(
+            url, params, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_new.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res_new.json()), 2)
+
+    def test_line_moved_to_other_meta_invalidates_both(self):
+        """Test moving a line to another species metadata changes the
+        line queries of the metadata it left too."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        other_meta = create_meta(species.id, linelist.id, molecule_tag=2)
+        line = create_line(meta.id, frequency=100.000)
+        create_line(meta.id, frequency=200.000)
+        url = reverse('data:line-query')
+        params = {'min_freq': '99.000', 'meta': meta.id}
+        res = self.client.get(url, params)
+        line.meta = other_meta
+        line.save()
+        res_moved = self.client.get(
+            url, params, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_moved.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res_moved.json()), 1)
+        cache.clear()
+        res_again = self.client.get(
+            url, params, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_again.status_code, status.HTTP_200_OK)
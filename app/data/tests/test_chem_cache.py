@@ -0,0 +1,47 @@
+"""
+Tests for the cache of molecules and fields derived from SMILES.
+"""
+from django.test import SimpleTestCase
+from rdkit import Chem
+
+from data import chem, chem_cache
+
+
+class ChemCacheTests(SimpleTestCase):
+    """Test the SMILES derivation cache."""
+
+    def setUp(self):
+        chem_cache.cache_clear()
+
+    def test_repeated_smiles_hits_cache(self):
+        """Test deriving the same SMILES again hits the cache."""
+        self.assertEqual(chem_cache.canonical_smiles('OCC'), 'CCO')
+        self.assertEqual(chem_cache.canonical_smiles('OCC'), 'CCO')
+        info = chem_cache.cache_info()['canonical_smiles']
+        self.assertEqual((info['hits'], info['misses']), (1, 1))
+        self.assertEqual(chem_cache.selfies_encoder('CCO'), '[C][C][O]')
+        self.assertAlmostEqual(chem_cache.molecular_mass('CCO'),
+                               46.041864812)
+
+    def test_invalid_smiles(self):
+        """Test SMILES that cannot be parsed give None."""
+        self.assertIsNone(chem_cache.mol_from_smiles('C1CC'))
+        self.assertIsNone(chem_cache.canonical_smiles('C1CC'))
+        self.assertIsNone(chem_cache.molecular_mass('C1CC'))
+        self.assertIsNone(chem_cache.species_fields('C1CC')[0])
+        self.assertIsNone(chem_cache.query_pattern_fp_bits('[C'))
+
+    def test_cached_molecules_are_copies(self):
+        """Test changing a returned molecule or fingerprint leaves the
+        cached ones unchanged."""
+        mol = chem_cache.mol_from_smiles('CCO')
+        mol.GetAtomWithIdx(0).SetAtomicNum(7)
+        self.assertEqual(Chem.MolToSmiles(chem_cache.mol_from_smiles('CCO')),
+                         'CCO')
+        fields, _ = chem_cache.species_fields('CCO')
+        fields['morgan_fp'].SetBit(0)
+        fields['pattern_fp'].append(-1)
+        mol = Chem.MolFromSmiles('CCO')
+        fields, _ = chem_cache.species_fields('CCO')
+        self.assertEqual(fields['morgan_fp'], chem.morgan_fp(mol))
+        self.assertEqual(fields['pattern_fp'], chem.pattern_fp_bits(mol))
@@ -0,0 +1,82 @@
+"""
+Test the data management commands.
+"""
+import os
+import tempfile
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from core.models import Line
+from data.tests.test_line_api import (CAT_CONTENT, QPART_CONTENT,
+                                      QPART_DICT, create_line,
+                                      create_linelist, create_meta,
+                                      create_species)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LoadCatCommandTests(TestCase):
+    """Test the load_cat command."""
+
+    def setUp(self):
+        species = create_species()
+        linelist = create_linelist()
+        self.meta = create_meta(species.id, linelist.id,
+                                qpart_file=SimpleUploadedFile(
+                                    'test.qpart', QPART_CONTENT),
+                                partition_function=QPART_DICT)
+        with tempfile.NamedTemporaryFile(suffix='.cat',
+                                         delete=False) as cat_file:
+            cat_file.write(CAT_CONTENT)
+        self.cat_path = cat_file.name
+
+    def test_load_cat(self):
+        """Test loading a .cat file with COPY."""
+        call_command('load_cat', self.meta.id, self.cat_path,
+                     qn_labels='J,Ka,Kc', notes='Test load')
+        lines = Line.objects.filter(meta=self.meta)
+        self.assertEqual(lines.count(), 4)
+        self.assertTrue(all(line.notes == 'Test load' for line in lines))
+        history = Line.history.filter(meta=self.meta)
+        self.assertEqual(sorted(history.values_list('id', flat=True)),
+                         sorted(lines.values_list('id', flat=True)))
+        self.assertEqual(set(history.values_list(
+            'history_type', 'history_change_reason')),
+            {('+', f'Upload of {os.path.basename(self.cat_path)}')})
+
+    def test_load_cat_in_chunks(self):
+        """Test loading a .cat file with COPY in chunks."""
+        call_command('load_cat', self.meta.id, self.cat_path,
+                     qn_labels='J,Ka,Kc', chunk_size=2)
+        self.assertEqual(Line.objects.filter(meta=self.meta).count(), 4)
+
+    def test_load_cat_qn_label_mismatch(self):
+        """Test loading fails if the labels do not match the .cat file."""
+        with self.assertRaises(CommandError):
+            call_command('load_cat', self.meta.id, self.cat_path,
+                         qn_labels='J,Ka')
+        self.assertFalse(Line.objects.filter(meta=self.meta).exists())
+
+
+class ExportLinesCommandTests(TestCase):
+    """Test the export_lines command."""
+
+    def test_export_lines_npz(self):
+        """Test exporting the lines of a species metadata to .npz."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=100.000)
+        output = os.path.join(tempfile.mkdtemp(), 'lines.npz')
+        call_command('export_lines', output, meta=[meta.id])
+        columns = np.load(output)
+        self.assertEqual(columns['frequency'].tolist(), [100.0])
+        self.assertEqual(columns['meta_id'].tolist(), [meta.id])
+
+    def test_export_lines_without_ids_fails(self):
+        """Test exporting without a linelist or metadata fails."""
+        with self.assertRaises(CommandError):
+            call_command('export_lines', 'lines.npz')
@@ -7,13 +7,43 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import Linelist, Species, SpeciesMetadata, Line
-from data.serializers import LineSerializer
+from data.serializers import (LineSerializer, QuerySerializer,
+                              QueryValuesSerializer)
+import io
 import json
+import math
 from rdkit import Chem
 from rdkit.Chem import Descriptors
 import selfies as sf
+import numpy as np
 import tempfile
 from django.core.files import File as DjangoFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+CAT_CONTENT = b"""\
+   40401.7690  0.0020 -4.9120 3    0.0000  5  440011303 2 0 2       1 0 1
+   50401.7690  0.0020 -4.5120 3    1.3477  7  440011303 3 0 3       2 0 2
+   60401.7690  0.0020 -4.3120 3    3.0286  9  440011303 4 0 4       3 0 3
+   70401.7690  0.0020******** 3    5.0433 11  440011303 5 0 5       4 0 4
+   80401.7690  0.0020 -4.1120 3    8.3977 11  440011303 5 1 5       4 1 4
+"""
+
+QPART_CONTENT = b"""\
+#form : interpolation
+9.375 10.0
+18.75 30.0
+37.5 80.0
+75.0 200.0
+150.0 600.0
+300.000 1700.0
+500.0 3500.0
+"""
+
+# The partition function stored for QPART_CONTENT by the metadata API.
+QPART_DICT = {'9.375': '10.0', '18.75': '30.0', '37.5': '80.0',
+              '75.0': '200.0', '150.0': '600.0', '300.000': '1700.0',
+              '500.0': '3500.0'}
 
 
 def create_linelist(linelist_name='Test Linelist'):
@@ -194,6 +224,13 @@ class PublicLineApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_query_windows_no_auth_required(self):
+        """Test batch line queries do not require authentication."""
+        url = reverse('data:line-query-windows')
+        payload = {'windows': [{'min_freq': 99.000, 'max_freq': 101.000}]}
+        res = self.client.post(url, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
 
 class PrivateLineApiTests(TestCase):
     """Test the private line API."""
@@ -280,6 +317,86 @@ class PrivateLineApiTests(TestCase):
         res = self.client.post(url, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_create_lines_in_chunks(self):
+        """Test creating lines in chunks gives the same lines
+        as reading the whole .cat file at once."""
+        url = reverse('data:line-list')
+        species = create_species()
+        linelist = create_linelist()
+        metas = [create_meta(species.id, linelist.id,
+                             qpart_file=SimpleUploadedFile(
+                                 'test.qpart', QPART_CONTENT),
+                             partition_function=QPART_DICT)
+                 for _ in range(2)]
+        for meta, chunk_size in zip(metas, [None, 2]):
+            payload = {
+                'meta': meta.id,
+                'cat_file': SimpleUploadedFile('test.cat', CAT_CONTENT),
+                'qn_label_str': 'J,Ka,Kc',
+                'contains_rovibrational': False,
+                'vib_qn': '',
+                'notes': 'Test post'}
+            if chunk_size:
+                payload['chunk_size'] = chunk_size
+            res = self.client.post(url, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 4)
+        lines = [list(Line.objects.filter(meta=meta).order_by(
+            'frequency').values_list(
+                'frequency', 'intensity', 's_ij_mu2', 'a_ij',
+                'upper_state_energy', 'lower_state_degeneracy',
+                'lower_state_qn', 'upper_state_qn')) for meta in metas]
+        self.assertEqual(len(lines[0]), 4)
+        self.assertEqual(lines[0], lines[1])
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_create_lines_bulk(self):
+        """Test creating lines with bulk_create or COPY gives the same
+        lines as going through the serializer."""
+        url = reverse('data:line-list')
+        species = create_species()
+        linelist = create_linelist()
+        metas = [create_meta(species.id, linelist.id,
+                             qpart_file=SimpleUploadedFile(
+                                 'test.qpart', QPART_CONTENT),
+                             partition_function=QPART_DICT)
+                 for _ in range(3)]
+        for meta, ingest_method in zip(metas,
+                                       ['serializer', 'bulk', 'copy']):
+            payload = {
+                'meta': meta.id,
+                'cat_file': SimpleUploadedFile('test.cat', CAT_CONTENT),
+                'qn_label_str': 'J,Ka,Kc',
+                'contains_rovibrational': False,
+                'vib_qn': '',
+                'notes': 'Test post',
+                'ingest_method': ingest_method,
+                '_change_reason': 'Test upload'}
+            res = self.client.post(url, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            if ingest_method == 'copy':
+                self.assertEqual(res.data['count'], 4)
+            else:
+                self.assertEqual(len(res.data), 4)
+        fields = ['frequency', 'uncertainty', 'intensity', 's_ij_mu2',
+                  'a_ij', 'lower_state_energy', 'upper_state_energy',
+                  'lower_state_degeneracy', 'upper_state_degeneracy',
+                  'lower_state_qn', 'upper_state_qn', 'rovibrational',
+                  'pickett_qn_code', 'pickett_lower_state_qn',
+                  'pickett_upper_state_qn', 'notes']
+        lines = [list(Line.objects.filter(meta=meta).order_by(
+            'frequency').values_list(*fields)) for meta in metas]
+        self.assertEqual(len(lines[0]), 4)
+        self.assertEqual(lines[0], lines[1])
+        self.assertEqual(lines[0], lines[2])
+        for meta in metas[1:]:
+            history = Line.history.filter(meta=meta)
+            self.assertEqual(history.count(), 4)
+            self.assertEqual(set(history.values_list(
+                'history_type', 'history_change_reason', 'history_user')),
+                {('+', 'Test upload', self.user.id)})
+
     def test_partial_update(self):
         """Test updating a line with patch."""
         species = create_species()
@@ -434,6 +551,246 @@ class PrivateLineApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 1)
 
+    def test_query_lines_paginated(self):
+        """Test querying lines page by page with the next token."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        for frequency in [300.000, 100.000, 200.000, 200.000, 400.000]:
+            create_line(meta.id, frequency=frequency)
+        url = reverse('data:line-query')
+        params = {'min_freq': '99.000', 'max_freq': '301.000',
+                  'page_size': 2}
+        pages = []
+        while True:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([float(line['frequency'])
+                          for line in res.data['results']])
+            if res.data['next'] is None:
+                break
+            params['cursor'] = res.data['next']
+        self.assertEqual(pages, [[100.0, 200.0], [200.0, 300.0]])
+
+    def test_query_lines_invalid_cursor_fails(self):
+        """Test querying lines with an invalid next token fails."""
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': '99.000', 'page_size': 2,
+                                    'cursor': 'invalid'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_lines_stream(self):
+        """Test streaming queried lines as newline-delimited JSON."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=200.000)
+        create_line(meta.id, frequency=100.000)
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': '99.000', 'stream': 'true'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in
+                 b''.join(res.streaming_content).splitlines()]
+        self.assertEqual([float(line['frequency']) for line in lines],
+                         [100.0, 200.0])
+        self.assertEqual(lines[0]['meta_id'], meta.id)
+
+    def test_query_lines_at_temperature(self):
+        """Test querying lines with intensities rescaled to a
+        temperature."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id,
+                           partition_function=QPART_DICT)
+        no_partition_meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=100.000, s_ij_mu2=2.0,
+                    lower_state_energy=0.0, upper_state_energy=10.0)
+        create_line(no_partition_meta.id, frequency=200.000)
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': '99.000',
+                                    'temperature': '300'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        expected = math.log10(2.0 * 100.0 * (1 - math.exp(-10.0 / 300)) /
+                              (2.40251E4 * 1700.0))
+        self.assertAlmostEqual(float(res.data[0]['scaled_intensity']),
+                               expected, places=4)
+        self.assertIsNone(res.data[1]['scaled_intensity'])
+        res = self.client.get(url, {'min_freq': '99.000',
+                                    'temperature': '300', 'stream': 'true'})
+        lines = [json.loads(line) for line in
+                 b''.join(res.streaming_content).splitlines()]
+        self.assertAlmostEqual(float(lines[0]['scaled_intensity']),
+                               expected, places=4)
+
+    def test_query_lines_invalid_temperature_fails(self):
+        """Test querying lines at a temperature that is not a positive
+        number fails."""
+        url = reverse('data:line-query')
+        for temperature in ['abc', '0', '-10', 'inf']:
+            res = self.client.get(url, {'min_freq': '99.000',
+                                        'temperature': temperature})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_lines_min_intensity(self):
+        """Test querying lines with an intensity threshold."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=100.000, intensity=-3.0)
+        create_line(meta.id, frequency=200.000, intensity=-6.0)
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': '99.000',
+                                    'min_intensity': '-5'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([float(line['frequency']) for line in res.data],
+                         [100.0])
+
+    def test_query_lines_top_n_per_species(self):
+        """Test querying the most intense lines of every species."""
+        species = create_species()
+        other_species = create_species(
+            iupac_name='Other IUPAC Name', smiles='CO')
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        other_meta = create_meta(species.id, linelist.id, molecule_tag=2)
+        third_meta = create_meta(other_species.id, linelist.id)
+        create_line(meta.id, frequency=100.000, intensity=-3.0)
+        create_line(other_meta.id, frequency=110.000, intensity=-1.0)
+        create_line(meta.id, frequency=120.000, intensity=-2.0)
+        create_line(third_meta.id, frequency=130.000, intensity=-5.0)
+        create_line(third_meta.id, frequency=140.000, intensity=-4.0)
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': '99.000',
+                                    'top_n_per_species': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([float(line['frequency']) for line in res.data],
+                         [110.0, 140.0])
+        res = self.client.get(url, {'min_freq': '99.000', 'page_size': 1,
+                                    'top_n_per_species': 2})
+        self.assertEqual([float(line['frequency'])
+                          for line in res.data['results']], [110.0])
+
+    def test_query_lines_by_species_linelist_and_meta(self):
+        """Test querying lines of given species, linelists and
+        metadata."""
+        species = create_species()
+        other_species = create_species(
+            iupac_name='Other IUPAC Name', smiles='CO')
+        linelist = create_linelist()
+        other_linelist = create_linelist(linelist_name='Other Linelist')
+        meta = create_meta(species.id, linelist.id)
+        other_meta = create_meta(other_species.id, other_linelist.id)
+        create_line(meta.id, frequency=100.000)
+        create_line(other_meta.id, frequency=200.000)
+        url = reverse('data:line-query')
+        for params, frequencies in [
+                ({'species': species.id}, [100.0]),
+                ({'linelist': other_linelist.id}, [200.0]),
+                ({'meta': f'{meta.id},{other_meta.id}'}, [100.0, 200.0]),
+                ({'species': species.id, 'linelist': other_linelist.id},
+                 [])]:
+            res = self.client.get(url, {'min_freq': '99.000', **params})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [float(line['frequency']) for line in res.data],
+                frequencies, msg=params)
+
+    def test_query_lines_invalid_filters_fail(self):
+        """Test querying lines with invalid intensity, top-N or id
+        filters fails."""
+        url = reverse('data:line-query')
+        for params in [{'min_intensity': 'abc'},
+                       {'top_n_per_species': '0'},
+                       {'top_n_per_species': 'abc'},
+                       {'species': '1,abc'}]:
+            res = self.client.get(url, {'min_freq': '99.000', **params})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST,
+                             msg=params)
+
+    def test_export_lines_npz(self):
+        """Test exporting the lines of a linelist as .npz columns."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=200.000)
+        create_line(meta.id, frequency=100.000, s_ij=0.5)
+        url = reverse('data:line-export')
+        res = self.client.get(url, {'linelist': linelist.id,
+                                    'file_format': 'npz'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        columns = np.load(io.BytesIO(b''.join(res.streaming_content)))
+        self.assertEqual(columns['frequency'].dtype, np.float64)
+        self.assertEqual(columns['frequency'].tolist(), [200.0, 100.0])
+        self.assertTrue(np.isnan(columns['s_ij'][0]))
+        self.assertEqual(columns['upper_state_degeneracy'].dtype.kind, 'i')
+        self.assertEqual(columns['lower_state_qn_J'].tolist(), [1, 1])
+        self.assertEqual(columns['upper_state_qn_Kc'].tolist(), [1, 1])
+
+    def test_export_lines_invalid_fails(self):
+        """Test exporting lines without ids or with an unknown format
+        fails."""
+        url = reverse('data:line-export')
+        for params in [{}, {'meta': 'abc'},
+                       {'meta': '1', 'file_format': 'csv'}]:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST,
+                             msg=params)
+
+    def test_query_values_serializer_matches_query_serializer(self):
+        """Test the values_list serializer of line queries gives the same
+        output as QuerySerializer."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        create_line(meta.id, frequency=100.000)
+        create_line(meta.id, frequency=200.000, s_ij=0.5)
+        queryset = Line.objects.order_by('frequency', 'id')
+        expected = QuerySerializer(queryset, many=True).data
+        result = QueryValuesSerializer(
+            QueryValuesSerializer.project(queryset), many=True).data
+        self.assertEqual(json.loads(json.dumps(result)),
+                         json.loads(json.dumps(expected)))
+
+    def test_query_lines_invalid_freq_fails(self):
+        """Test querying lines with a frequency that is not a number
+        fails."""
+        url = reverse('data:line-query')
+        res = self.client.get(url, {'min_freq': 'abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_windows(self):
+        """Test querying lines in many frequency windows at once."""
+        species = create_species()
+        linelist = create_linelist()
+        meta = create_meta(species.id, linelist.id)
+        for frequency in [100.000, 150.000, 200.000, 300.000]:
+            create_line(meta.id, frequency=frequency)
+        url = reverse('data:line-query-windows')
+        payload = {'windows': [
+            {'center': 200.000, 'tolerance': 60.000},
+            {'min_freq': 99.000, 'max_freq': 101.000},
+            {'min_freq': 400.000, 'max_freq': 500.000}]}
+        res = self.client.post(url, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([(window['min_freq'], window['max_freq'])
+                          for window in res.data],
+                         [(140.0, 260.0), (99.0, 101.0), (400.0, 500.0)])
+        self.assertEqual([[float(line['frequency'])
+                           for line in window['lines']]
+                          for window in res.data],
+                         [[150.0, 200.0], [100.0], []])
+        expected = QueryValuesSerializer(QueryValuesSerializer.project(
+            Line.objects.filter(frequency=100.000)).get()).data
+        self.assertEqual(res.data[1]['lines'][0], expected)
+
+    def test_query_windows_invalid_window_fails(self):
+        """Test querying lines with an incomplete window fails."""
+        url = reverse('data:line-query-windows')
+        payload = {'windows': [{'center': 200.000}]}
+        res = self.client.post(url, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_query_lines_without_freq_fails(self):
         """Test querying lines without frequency specified fails."""
         url = reverse('data:line-query')
@@ -0,0 +1,129 @@
+"""
+Tests for .cat file parsing.
+"""
+import io
+import json
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from data.parse_line import (parse_cat, _fix_spcat, _decode_qn_column,
+                             _qn_codes, _pack_qn_codes, _unpack_qn_keys,
+                             _count_qns, _qnstr_column, _qn_json_column)
+
+
+class DecodeQnColumnTests(SimpleTestCase):
+    """Test the lookup-table decoder for SPCAT quantum number fields."""
+
+    def test_decode_matches_fix_spcat_for_every_code(self):
+        """Test the decoder agrees with _fix_spcat on every
+        2-character ASCII code."""
+        for first in range(128):
+            for second in range(128):
+                field = bytes([first, second])
+                column = np.array([field], dtype='S2')
+                try:
+                    expected = _fix_spcat(
+                        field.rstrip(b'\x00').decode().strip())
+                except (ValueError, IndexError):
+                    with self.assertRaises(ValueError, msg=field):
+                        _decode_qn_column(column)
+                    continue
+                self.assertEqual(
+                    _decode_qn_column(column).tolist(), [expected],
+                    msg=field)
+
+    def test_decode_column(self):
+        """Test decoding a column of plain, signed and lettered values."""
+        column = np.array([b' 5', b'12', b'-3', b'A3', b'a3'], dtype='S2')
+        values = _decode_qn_column(column)
+        self.assertEqual(values.dtype.kind, 'i')
+        self.assertEqual(values.tolist(), [5, 12, -3, 103, -13])
+
+    def test_decode_column_with_blanks(self):
+        """Test blank fields decode to None."""
+        column = np.array([b' 5', b'  ', b''], dtype='S2')
+        values = _decode_qn_column(column)
+        self.assertEqual(values.tolist(), [5, None, None])
+
+
+class PackedQnKeyTests(SimpleTestCase):
+    """Test packing the quantum numbers of a state into int64 keys."""
+
+    def _codes(self, rows):
+        return [_qn_codes(np.array(column, dtype='S2'))
+                for column in zip(*rows)]
+
+    def test_pack_unpack(self):
+        """Test unpacking packed keys gives back the quantum numbers."""
+        codes = self._codes([[b' 5', b'12', b'-3', b'  ', b'  ', b'  '],
+                             [b'Z9', b'z9', b' 0', b'  ', b'  ', b'  ']])
+        keys = _pack_qn_codes(codes)
+        self.assertEqual(_unpack_qn_keys(keys, 3).tolist(),
+                         [[5, 12, -3], [359, -269, 0]])
+        self.assertEqual(_count_qns(keys[0]), 3)
+
+    def test_distinct_states_have_distinct_keys(self):
+        """Test keys tell apart states with the same quantum numbers in
+        a different order or with blanks."""
+        codes = self._codes([[b' 1', b'10', b'  '],
+                             [b'11', b' 0', b'  '],
+                             [b' 1', b'10', b' 0']])
+        self.assertEqual(len(set(_pack_qn_codes(codes).tolist())), 3)
+
+    def test_qnstr_column(self):
+        """Test formatting keys as zero-padded quantum number strings."""
+        codes = self._codes([[b' 5', b'-3', b'  '],
+                             [b'A0', b' 0', b'  ']])
+        self.assertEqual(_qnstr_column(_pack_qn_codes(codes)).tolist(),
+                         ['05-3', '10000'])
+
+    def test_qn_json_column(self):
+        """Test encoding keys as the JSON of their label dicts."""
+        codes = self._codes([[b' 5', b'-3', b'  '],
+                             [b'A0', b' 0', b'  '],
+                             [b' 5', b'-3', b'  ']])
+        labels = ['J', 'N']
+        self.assertEqual(
+            _qn_json_column(_pack_qn_codes(codes), labels).tolist(),
+            [json.dumps({'J': 5, 'N': -3}), json.dumps({'J': 100, 'N': 0}),
+             json.dumps({'J': 5, 'N': -3})])
+
+
+CAT_CONTENT = b"""\
+   40401.7690  0.0020 -4.9120 3    0.0000  5  440011303 2 0 2       1 0 1
+   50401.7690  0.0020 -4.5120 3    1.3477  7  440011303 3 0 3       2 0 2
+   80401.7690  0.0020 -4.1120 3    8.3977 11  440011303 5 1 5       4 1 4
+"""
+
+QPART = """\
+#form : interpolation
+9.375 10.0
+150.0 600.0
+300.000 1700.0
+"""
+
+
+class ParseCatQnJsonTests(SimpleTestCase):
+    """Test parsing quantum numbers into JSON columns or dicts."""
+
+    def _parse(self, qn_json):
+        return parse_cat(io.BytesIO(CAT_CONTENT), ['J', 'Ka', 'Kc'],
+                         qpart_file=io.StringIO(QPART), qn_json=qn_json)
+
+    def test_qn_json_matches_dicts(self):
+        """Test the JSON columns encode the dicts of the default parse,
+        and each parse only builds one of them."""
+        parsed_dicts = self._parse(False)
+        parsed_json = self._parse(True)
+        self.assertIsNone(parsed_dicts.lower_state_qn_json)
+        self.assertIsNone(parsed_json.lower_state_qn_dict_list)
+        self.assertEqual(
+            parsed_json.upper_state_qn_json.tolist(),
+            [json.dumps(qns)
+             for qns in parsed_dicts.upper_state_qn_dict_list])
+        self.assertEqual(
+            parsed_json.lower_state_qns.tolist(),
+            [list(qns.values())
+             for qns in parsed_dicts.lower_state_qn_dict_list])
+        self.assertEqual(parsed_json.qn_labels, ['J', 'Ka', 'Kc'])
@@ -0,0 +1,90 @@
+"""
+Tests for the species metadata partition function cache.
+"""
+import io
+from types import SimpleNamespace
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from data import partition
+from data.class_parse_catfile import PartitionFunction
+from data.parse_line import _make_partition_function
+
+QPART = """\
+#form : interpolation
+9.375 10.0
+37.5 80.0
+150.0 600.0
+300.000 1700.0
+500.0 3500.0
+"""
+
+
+def make_meta(pk=1, qpart_file_name='uploads/sp/test.qpart'):
+    """Helper function to make a stand-in species metadata."""
+    return SimpleNamespace(
+        pk=pk, qpart_file=SimpleNamespace(name=qpart_file_name),
+        partition_function={'9.375': '10.0', '37.5': '80.0',
+                            '150.0': '600.0', '300.000': '1700.0',
+                            '500.0': '3500.0'})
+
+
+class PartitionFunctionCacheTests(SimpleTestCase):
+    """Test the partition function cache."""
+
+    def setUp(self):
+        partition.cache_clear()
+
+    def test_matches_qpart_file(self):
+        """Test the cached partition function matches the one read from
+        the .qpart file."""
+        from_file = _make_partition_function(
+            qpart_file=io.StringIO(QPART))
+        cached = partition.get_partition_function(make_meta())
+        for temp in [9.375, 75.0, 300.0, 1000.0]:
+            self.assertAlmostEqual(cached.qrot(temp), from_file.qrot(temp))
+
+    def test_cache_hit(self):
+        """Test the same metadata and qpart file hit the cache."""
+        first = partition.get_partition_function(make_meta())
+        second = partition.get_partition_function(make_meta())
+        self.assertIs(first, second)
+        self.assertEqual(partition.cache_info().hits, 1)
+
+    def test_new_qpart_file_misses_cache(self):
+        """Test a new qpart file or metadata gets its own entry."""
+        first = partition.get_partition_function(make_meta())
+        self.assertIsNot(first, partition.get_partition_function(
+            make_meta(qpart_file_name='uploads/sp/new.qpart')))
+        self.assertIsNot(first, partition.get_partition_function(
+            make_meta(pk=2)))
+
+    def test_json_string_partition_function(self):
+        """Test partition functions stored as JSON text."""
+        meta = make_meta()
+        meta.partition_function = '{"9.375": "10.0", "300.000": "1700.0"}'
+        self.assertAlmostEqual(
+            partition.get_partition_function(meta).qrot(300), 1700.0)
+
+
+class PartitionFunctionArrayTests(SimpleTestCase):
+    """Test evaluating partition functions over arrays of
+    temperatures."""
+
+    def test_interpolation_array_matches_scalars(self):
+        """Test an array of temperatures gives the scalar values."""
+        function = _make_partition_function(qpart_file=io.StringIO(QPART))
+        temps = np.array([9.375, 75.0, 300.0, 1000.0])
+        np.testing.assert_allclose(
+            function.q(temps), [function.q(temp) for temp in temps])
+        self.assertIsInstance(function.qrot(300.0), float)
+
+    def test_counting_and_vibrational_array_matches_scalars(self):
+        """Test state counting with vibrational states over arrays."""
+        function = PartitionFunction(
+            gs=np.array([1.0, 3.0, 5.0]), energies=np.array([0.0, 10.0, 30.0]),
+            vib_states=np.array([300.0, 700.0]))
+        temps = np.array([5.0, 50.0, 500.0])
+        np.testing.assert_allclose(
+            function.q(temps), [function.q(temp) for temp in temps])
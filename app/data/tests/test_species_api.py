@@ -2,7 +2,10 @@
 Test species APIs.
 """
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from unittest.mock import patch
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -11,6 +14,10 @@ from rdkit import Chem
 from rdkit.Chem import Descriptors
 import selfies as sf
 import json
+import tempfile
+from core import depiction
+from data import chem, ingest
+from data.views import SpeciesViewSet
 
 
 def create_linelist(linelist_name='Test Linelist'):
@@ -152,6 +159,7 @@ class PublicSpeciesApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class PrivateSpeciesApiTests(TestCase):
     """Test the private species API."""
 
@@ -314,3 +322,304 @@ class PrivateSpeciesApiTests(TestCase):
         res = self.client.delete(url)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertTrue(Species.objects.filter(id=species.id).exists())
+
+    def _post_species(self, smiles, iupac_name):
+        """Create a species through the API."""
+        payload = {
+            'name': json.dumps(['common_name', 'Test Species']),
+            'iupac_name': iupac_name,
+            'name_formula': 'Test Name Formula',
+            'name_html': 'Test Name HTML',
+            'smiles': smiles,
+            'standard_inchi': 'test inchi',
+            'standard_inchi_key': 'test inchi',
+            'notes': 'Test Species',
+        }
+        res = self.client.post(reverse('data:species-list'), payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return Species.objects.get(id=res.data['id'])
+
+    def test_create_species_fingerprints(self):
+        """Test creating a species stores its fingerprints."""
+        species = self._post_species('CCCC', 'Test IUPAC Name')
+        mol = Chem.MolFromSmiles('CCCC')
+        self.assertEqual(species.pattern_fp, chem.pattern_fp_bits(mol))
+        self.assertEqual(species.morgan_fp, chem.morgan_fp(mol))
+
+    def test_update_species_mol_updates_fingerprints(self):
+        """Test updating the mol object of a species recomputes its
+        fingerprints."""
+        species = self._post_species('CCCC', 'Test IUPAC Name')
+        url = reverse('data:species-detail', args=[species.id])
+        payload = {'mol_obj': 'c1ccccc1O',
+                   '_change_reason': 'Test change reason'}
+        res = self.client.patch(url, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        species.refresh_from_db()
+        self.assertEqual(species.pattern_fp, chem.pattern_fp_bits(
+            Chem.MolFromSmiles('c1ccccc1O')))
+
+    def test_save_species_mol_updates_fingerprints(self):
+        """Test saving a new rdkit mol object outside the API recomputes
+        the fingerprints, and updating it clears them."""
+        species = self._post_species('CCCC', 'Test IUPAC Name')
+        species.mol_obj = Chem.MolFromSmiles('c1ccccc1O')
+        species.save(update_fields=['mol_obj'])
+        species.refresh_from_db()
+        mol = Chem.MolFromSmiles('c1ccccc1O')
+        self.assertEqual(species.pattern_fp, chem.pattern_fp_bits(mol))
+        self.assertEqual(species.morgan_fp, chem.morgan_fp(mol))
+        Species.objects.filter(id=species.id).update(mol_obj='CCO')
+        species.refresh_from_db()
+        self.assertIsNone(species.pattern_fp)
+        self.assertIsNone(species.morgan_fp)
+        res = self.client.get(reverse('data:species-list'),
+                              {'substruct': '[OX2H]'})
+        self.assertEqual([found['id'] for found in res.data], [species.id])
+
+    def test_update_species_smiles_derives_fields(self):
+        """Test updating the smiles of a species canonicalizes them and
+        derives their selfies and molecular mass."""
+        species = create_species(iupac_name='test iupac smiles update')
+        url = reverse('data:species-detail', args=[species.id])
+        res = self.client.patch(url, {'smiles': 'OCC',
+                                      '_change_reason': 'Test reason'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        species.refresh_from_db()
+        self.assertEqual(species.smiles, 'CCO')
+        self.assertEqual(species.selfies, sf.encoder('CCO'))
+        self.assertAlmostEqual(float(species.molecular_mass),
+                               Descriptors.ExactMolWt(
+                                   Chem.MolFromSmiles('CCO')))
+        res = self.client.patch(url, {'smiles': 'C1CC',
+                                      '_change_reason': 'Test reason'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_species_smiles_derives_mol(self):
+        """Test updating only the smiles of a species derives its rdkit
+        mol object, fingerprints and depiction from them."""
+        species = self._post_species('CCCC', 'Test IUPAC Name')
+        url = reverse('data:species-detail', args=[species.id])
+        res = self.client.patch(url, {'smiles': 'c1ccccc1O',
+                                      '_change_reason': 'Test reason'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        species.refresh_from_db()
+        mol = Chem.MolFromSmiles('Oc1ccccc1')
+        self.assertEqual(Chem.MolToSmiles(species.mol_obj), 'Oc1ccccc1')
+        self.assertEqual(species.pattern_fp, chem.pattern_fp_bits(mol))
+        self.assertEqual(species.morgan_fp, chem.morgan_fp(mol))
+        self.assertEqual(species.depiction_key,
+                         depiction.smiles_key('Oc1ccccc1'))
+        self.assertTrue(default_storage.exists(
+            depiction.depiction_path(species.depiction_key)))
+
+    def test_update_species_smiles_other_mol_rejected(self):
+        """Test updating a species with smiles and an rdkit mol object of
+        different molecules fails."""
+        species = self._post_species('CCCC', 'Test IUPAC Name')
+        url = reverse('data:species-detail', args=[species.id])
+        res = self.client.patch(url, {'smiles': 'CCO', 'mol_obj': 'CCC',
+                                      '_change_reason': 'Test reason'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('mol_obj', res.data)
+        species.refresh_from_db()
+        self.assertEqual(species.smiles, 'CCCC')
+
+    def test_substruct_search(self):
+        """Test substructure searches screened by pattern fingerprints,
+        keeping species without fingerprints."""
+        phenol = self._post_species('c1ccccc1O', 'phenol')
+        self._post_species('CCCC', 'butane')
+        ethanol = create_species(iupac_name='ethanol', smiles='CCO')
+        url = reverse('data:species-list')
+        res = self.client.get(url, {'substruct': '[OX2H]'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(species['id'] for species in res.data),
+                         sorted([phenol.id, ethanol.id]))
+
+    def test_similar_species(self):
+        """Test a similarity search ranks species by the similarity of
+        their fingerprints, above the threshold."""
+        butane = self._post_species('CCCC', 'butane')
+        pentane = self._post_species('CCCCC', 'pentane')
+        self._post_species('c1ccccc1O', 'phenol')
+        url = reverse('data:species-similar')
+        res = self.client.get(url, {'smiles': 'CCCC', 'threshold': 0.3})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([species['id'] for species in res.data],
+                         [butane.id, pentane.id])
+        self.assertAlmostEqual(res.data[0]['similarity'], 1.0)
+        res_dice = self.client.get(
+            url, {'smiles': 'CCCC', 'metric': 'dice', 'top_k': 1})
+        self.assertEqual([species['id'] for species in res_dice.data],
+                         [butane.id])
+
+    def test_similar_species_invalid_params(self):
+        """Test a similarity search with invalid parameters fails."""
+        url = reverse('data:species-similar')
+        for params in [{}, {'smiles': 'not a smiles'},
+                       {'smiles': 'CCCC', 'threshold': 2},
+                       {'smiles': 'CCCC', 'top_k': 0},
+                       {'smiles': 'CCCC', 'top_k': 'ten'},
+                       {'smiles': 'CCCC', 'metric': 'cosine'}]:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_species_stores_depiction(self):
+        """Test creating a species stores its depiction, keyed by its
+        canonical SMILES."""
+        species = self._post_species('OCC', 'ethanol')
+        key = depiction.depiction_key(Chem.MolFromSmiles('CCO'))
+        self.assertTrue(default_storage.exists(
+            depiction.depiction_path(key)))
+        self.assertEqual(species.depiction_key, key)
+        res = self.client.get(reverse('data:species-detail',
+                                      args=[species.id]))
+        self.assertEqual(res.data['image_url'], species.image_url)
+        self.assertTrue(species.image_url.endswith(f'?v={key}'))
+        self.assertIn(species.image_url, species.display_mol())
+
+    def test_species_image(self):
+        """Test the depiction of a species is cached for good when
+        requested with its current key, and revalidated otherwise."""
+        species = self._post_species('CCCC', 'butane')
+        # Depictions missing from the storage are rendered again.
+        default_storage.delete(
+            depiction.depiction_path(species.depiction_key))
+        res = self.client.get(species.image_url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/png')
+        self.assertTrue(b''.join(res.streaming_content).startswith(
+            b'\x89PNG'))
+        self.assertIn('immutable', res['Cache-Control'])
+        url = reverse('data:species-image', args=[species.id])
+        res_stale = self.client.get(url, {'v': 'stale'})
+        self.assertIn('no-cache', res_stale['Cache-Control'])
+        res_revalidated = self.client.get(
+            url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res_revalidated.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def _bulk_row(self, smiles, iupac_name):
+        return {'name': ['common_name', iupac_name],
+                'iupac_name': iupac_name,
+                'name_formula': 'Test Name Formula',
+                'name_html': 'Test Name HTML',
+                'smiles': smiles,
+                'standard_inchi': 'test inchi',
+                'standard_inchi_key': 'test inchi',
+                'notes': 'Test Species'}
+
+    def test_bulk_create_species(self):
+        """Test creating species in bulk, returning the errors of the
+        rows that fail."""
+        create_species(iupac_name='existing')
+        payload = [self._bulk_row('OCC', 'ethanol'),
+                   self._bulk_row('C1CC', 'broken'),
+                   self._bulk_row('CCCC', 'existing'),
+                   self._bulk_row('CC', 'ethanol'),
+                   {'smiles': 'CC'},
+                   self._bulk_row('c1ccccc1O', 'phenol')]
+        res = self.client.post(reverse('data:species-bulk'), payload,
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([species['iupac_name']
+                          for species in res.data['created']],
+                         ['ethanol', 'phenol'])
+        self.assertEqual([error['row'] for error in res.data['errors']],
+                         [1, 2, 3, 4])
+        self.assertIn('smiles', res.data['errors'][0]['errors'])
+        self.assertIn('iupac_name', res.data['errors'][1]['errors'])
+        ethanol = Species.objects.get(iupac_name='ethanol')
+        mol = Chem.MolFromSmiles('CCO')
+        self.assertEqual(ethanol.smiles, 'CCO')
+        self.assertEqual(ethanol.selfies, sf.encoder('CCO'))
+        self.assertAlmostEqual(float(ethanol.molecular_mass),
+                               Descriptors.ExactMolWt(mol))
+        self.assertEqual(ethanol.pattern_fp, chem.pattern_fp_bits(mol))
+        self.assertEqual(ethanol.depiction_key,
+                         depiction.depiction_key(mol))
+        self.assertEqual(Species.history.filter(id=ethanol.id).count(), 1)
+
+    def test_bulk_create_species_name_of_failed_row(self):
+        """Test a row failing on its SMILES does not take its IUPAC name
+        from a later row."""
+        payload = [self._bulk_row('C1CC', 'ethanol'),
+                   self._bulk_row('OCC', 'ethanol')]
+        res = self.client.post(reverse('data:species-bulk'), payload,
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([species['iupac_name']
+                          for species in res.data['created']], ['ethanol'])
+        self.assertEqual(res.data['errors'][0]['row'], 0)
+        self.assertIn('smiles', res.data['errors'][0]['errors'])
+
+    def test_bulk_create_species_concurrent_name(self):
+        """Test a name taken by a concurrent request after the check
+        fails its row only."""
+        create_species(iupac_name='ethanol')
+        taken_rows = SpeciesViewSet._taken_rows
+        checks = []
+
+        def miss_first_check(view, iupac_names):
+            # The first check runs before the concurrent insert.
+            checks.append(iupac_names)
+            return [] if len(checks) == 1 else taken_rows(view, iupac_names)
+
+        payload = [self._bulk_row('OCC', 'ethanol'),
+                   self._bulk_row('CCCC', 'butane')]
+        with patch.object(SpeciesViewSet, '_taken_rows', autospec=True,
+                          side_effect=miss_first_check):
+            res = self.client.post(reverse('data:species-bulk'), payload,
+                                   format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([species['iupac_name']
+                          for species in res.data['created']], ['butane'])
+        self.assertEqual(res.data['errors'],
+                         [{'row': 0, 'errors': {'iupac_name': [
+                             'species with this iupac name already '
+                             'exists.']}}])
+
+    def test_bulk_create_species_csv(self):
+        """Test creating species in bulk from a CSV file."""
+        csv_file = SimpleUploadedFile('species.csv', (
+            'name,iupac_name,name_formula,name_html,smiles,'
+            'standard_inchi,standard_inchi_key\n'
+            'ethanol,ethanol,C2H5OH,C2H5OH,CCO,inchi,key\n'
+            '"[""butane"", ""n-butane""]",butane,C4H10,C4H10,CCCC,'
+            'inchi,key\n').encode())
+        res = self.client.post(reverse('data:species-bulk'),
+                               {'file': csv_file}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['errors'], [])
+        self.assertEqual(Species.objects.get(iupac_name='butane').name,
+                         ['butane', 'n-butane'])
+
+    def test_bulk_create_species_without_rows_fails(self):
+        """Test a bulk creation without species fails."""
+        res = self.client.post(reverse('data:species-bulk'), [],
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SPECIES_BULK_PARALLEL_MIN_ROWS=1)
+    def test_compute_species_fields_in_workers(self):
+        """Test computing species fields in worker processes gives the
+        fields of every SMILES in order."""
+        results = ingest.compute_species_fields(['OCC', 'C1CC', 'CC'],
+                                                workers=2)
+        self.assertEqual([fields and fields['smiles']
+                          for fields, _ in results], ['CCO', None, 'CC'])
+        self.assertIsNotNone(results[1][1])
+
+    def test_chem_cache_stats_admin_only(self):
+        """Test the SMILES derivation cache statistics are only shown to
+        admin users."""
+        url = reverse('data:chem-cache')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self._post_species('CCCC', 'butane')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(res.data['species_fields']['misses'], 1)
@@ -21,5 +21,7 @@ router.register('line', views.LineViewSet)
 app_name = 'data'
 
 urlpatterns = [
-    path('', include(router.urls))
+    path('', include(router.urls)),
+    path('chem-cache/', views.ChemCacheStatsView.as_view(),
+         name='chem-cache'),
 ]
@@ -4,31 +4,44 @@ Views for data APIs.
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 from django_rdkit.models import *  # noqa: F403
+from core import depiction
 from core.models import (Species, Linelist, SpeciesMetadata,
                          Reference, MetaReference, Line)
-from data import serializers
-from rdkit import Chem
-from rdkit.Chem import Descriptors
-import selfies as sf
-from django.db.models import ProtectedError
+from rest_framework.utils.encoders import JSONEncoder
+from data import (serializers, chem, chem_cache, export, ingest,
+                  intensity, queries)
+from data.cache import CachedResponseMixin
+from data.pagination import FrequencyKeysetPagination
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError, Q
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import (extend_schema, OpenApiParameter,
                                    OpenApiTypes, extend_schema_view)
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 import io
+import itertools
+import math
+import tempfile
 from data.parse_metadata import read_intfile, read_varfile, read_qpartfile
-from data.parse_line import parse_cat
+from data.parse_line import parse_cat, iter_parse_cat
+from data.partition import get_partition_function
 
 
-class LinelistViewSet(viewsets.ModelViewSet):
+class LinelistViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for linelist APIs."""
     serializer_class = serializers.LinelistSerializer
     queryset = Linelist.objects.all()
     authentication_classes = [TokenAuthentication]
+    cache_models = [Linelist]
 
     def get_permissions(self):
         """No authentication required for GET requests."""
@@ -79,11 +92,12 @@ is being referenced through protected foreign key"
             return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ReferenceViewSet(viewsets.ModelViewSet):
+class ReferenceViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for reference APIs."""
     serializer_class = serializers.ReferenceSerializer
     queryset = Reference.objects.all()
     authentication_classes = [TokenAuthentication]
+    cache_models = [Reference]
 
     def get_permissions(self):
         """No authentication required for GET requests."""
@@ -173,11 +187,12 @@ is being referenced through protected foreign key"
 @extend_schema_view(list=extend_schema(parameters=[
     OpenApiParameter("substruct", OpenApiTypes.STR,
                      description="Filter species by substructure")]))
-class SpeciesViewSet(viewsets.ModelViewSet):
+class SpeciesViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for species APIs."""
     serializer_class = serializers.SpeciesSerializer
     queryset = Species.objects.all()
     authentication_classes = [TokenAuthentication]
+    cache_models = [Species]
 
     def get_permissions(self):
         """No authentication required for GET requests."""
@@ -191,11 +206,22 @@ class SpeciesViewSet(viewsets.ModelViewSet):
         """Retrieve species"""
         substruct = self.request.query_params.get('substruct')
         if substruct:
-            return self.queryset.filter(
+            return self._screen_substruct(self.queryset, substruct).filter(
                 mol_obj__hassubstruct=QMOL(  # noqa: F405
                     Value(substruct))).order_by('-id')  # noqa: F405
         return self.queryset.order_by('-id')
 
+    def _screen_substruct(self, queryset, substruct):
+        """Keep the species whose pattern fingerprint contains the bits
+        of a substructure query, through the GIN index, so that the
+        exact substructure match only runs on them. Species without a
+        fingerprint are kept."""
+        bits = chem_cache.query_pattern_fp_bits(substruct)
+        if bits is None:
+            return queryset
+        return queryset.filter(Q(pattern_fp__contains=bits) |
+                               Q(pattern_fp__isnull=True))
+
     def get_serializer_class(self):
         """Return the serializer class for request."""
         if self.action in ['update', 'partial_update']:
@@ -205,14 +231,257 @@ class SpeciesViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Create a new species and autopopulate molecular mass,
         selfies, and rdkit mol object from canonical smiles."""
-        smiles = self.request.data.get('smiles')
-        canonical_smiles = Chem.CanonSmiles(smiles)
-        selfies_string = sf.encoder(canonical_smiles)
-        rdkit_mol_obj = Chem.MolFromSmiles(canonical_smiles)
-        molecular_mass = Descriptors.ExactMolWt(rdkit_mol_obj)
-        serializer.save(mol_obj=rdkit_mol_obj,
-                        smiles=canonical_smiles, selfies=selfies_string,
-                        molecular_mass=molecular_mass)
+        fields, error = chem_cache.species_fields(
+            serializer.validated_data['smiles'])
+        if error:
+            raise ValidationError({'smiles': [error]})
+        key = depiction.save_depiction(
+            fields['mol_obj'], depiction.smiles_key(fields['smiles']))
+        serializer.save(depiction_key=key, **fields)
+
+    def perform_update(self, serializer):
+        """Update a species. New smiles are canonicalized and the
+        selfies, molecular mass, rdkit mol object, fingerprints and
+        depiction derived from them, unless selfies or molecular mass
+        are given; a new rdkit mol object alone gets a new depiction,
+        and saving it new fingerprints."""
+        smiles = serializer.validated_data.get('smiles')
+        if smiles is not None:
+            fields, error = chem_cache.species_fields(smiles)
+            if error:
+                raise ValidationError({'smiles': [error]})
+            for field in ['selfies', 'molecular_mass']:
+                if field in serializer.validated_data:
+                    fields[field] = serializer.validated_data[field]
+            key = depiction.save_depiction(
+                fields['mol_obj'], depiction.smiles_key(fields['smiles']))
+            serializer.save(depiction_key=key, **fields)
+            return
+        mol_obj = serializer.validated_data.get('mol_obj')
+        if isinstance(mol_obj, str):
+            rdkit_mol_obj = chem_cache.mol_from_smiles(mol_obj)
+        else:
+            rdkit_mol_obj = chem.to_mol(mol_obj) if mol_obj else None
+        if rdkit_mol_obj is None:
+            serializer.save()
+        else:
+            serializer.save(
+                depiction_key=depiction.save_depiction(rdkit_mol_obj))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("v", OpenApiTypes.STR,
+                             description="Depiction key of the species, "
+                             "as in its image_url")
+        ],
+        responses={(200, 'image/png'): OpenApiTypes.BINARY}
+    )
+    @action(methods=['GET'], detail=True, url_path='image')
+    def image(self, request, pk=None):
+        """Return the stored PNG depiction of a species, rendering it
+        only if it is not stored. Requests versioned with the current
+        depiction key of the species may be cached for good; others
+        are revalidated against its ETag."""
+        species = self.get_object()
+        if not species.depiction_key:
+            return Response({'error': _('Species has no depiction')},
+                            status=status.HTTP_404_NOT_FOUND)
+        etag = quote_etag(species.depiction_key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            # A streaming response, which the response cache skips.
+            response = FileResponse(
+                depiction.open_depiction(species.depiction_key,
+                                         species.mol_obj),
+                content_type='image/png')
+        response['ETag'] = etag
+        if request.query_params.get('v') == species.depiction_key:
+            patch_cache_control(response, public=True,
+                                max_age=settings.DEPICTION_MAX_AGE,
+                                immutable=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    @extend_schema(
+        request={'application/json': serializers.SpeciesBulkSerializer(
+                     many=True),
+                 'multipart/form-data': {
+                     'type': 'object',
+                     'properties': {
+                         'file': {'type': 'string', 'format': 'binary'},
+                         '_change_reason': {'type': 'string'}}}},
+        responses={201: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT}
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create many species from a JSON list of species or a .csv or
+        .sdf file, computing the fields derived from their SMILES in
+        worker processes and inserting them with bulk_create. Rows that
+        fail are returned with their errors, without aborting the
+        others."""
+        rows, error_response = self._get_bulk_rows(request)
+        if error_response:
+            return error_response
+        errors = {}
+        valid_rows = {}
+        for i, row in enumerate(rows):
+            if row is None:
+                errors[i] = {'non_field_errors': [_('Invalid molecule')]}
+                continue
+            serializer = serializers.SpeciesBulkSerializer(data=row)
+            if serializer.is_valid():
+                valid_rows[i] = serializer.validated_data
+            else:
+                errors[i] = serializer.errors
+        for i in self._taken_rows({i: data['iupac_name']
+                                   for i, data in valid_rows.items()}):
+            errors[i] = self._existing_name_errors()
+            del valid_rows[i]
+        results = ingest.compute_species_fields(
+            [data['smiles'] for data in valid_rows.values()])
+        species = {}
+        names = set()
+        for (i, data), (fields, error) in zip(valid_rows.items(), results):
+            if error:
+                errors[i] = {'smiles': [error]}
+            elif data['iupac_name'] in names:
+                errors[i] = self._existing_name_errors()
+            else:
+                # Names are only taken by rows that get created.
+                names.add(data['iupac_name'])
+                species[i] = Species(
+                    depiction_key=depiction.smiles_key(fields['smiles']),
+                    **{**data, **fields})
+        change_reason = isinstance(request.data, dict) and \
+            request.data.get('_change_reason') or 'Bulk species creation'
+        try:
+            created = self._insert_bulk_species(species, change_reason)
+        except IntegrityError:
+            # A concurrent request took one of the names after they were
+            # checked. Those rows fail and the others are tried again.
+            for i in self._taken_rows({i: row.iupac_name
+                                       for i, row in species.items()}):
+                errors[i] = self._existing_name_errors()
+                del species[i]
+            try:
+                created = self._insert_bulk_species(species, change_reason)
+            except IntegrityError:
+                for i in species:
+                    errors[i] = {'non_field_errors': [
+                        _('species could not be created, try again.')]}
+                return self._bulk_response([], errors,
+                                           status.HTTP_409_CONFLICT)
+        return self._bulk_response(
+            created, errors, status.HTTP_201_CREATED if created
+            else status.HTTP_400_BAD_REQUEST)
+
+    def _existing_name_errors(self):
+        return {'iupac_name': [
+            _('species with this iupac name already exists.')]}
+
+    def _taken_rows(self, iupac_names):
+        """Return the row numbers of the IUPAC names, by row number,
+        taken by stored species."""
+        existing_names = set(Species.objects.filter(
+            iupac_name__in=iupac_names.values())
+            .values_list('iupac_name', flat=True))
+        return [i for i, iupac_name in iupac_names.items()
+                if iupac_name in existing_names]
+
+    def _insert_bulk_species(self, species, change_reason):
+        """Insert the species of a bulk creation in a savepoint, so a
+        failed insert can be tried again."""
+        with transaction.atomic():
+            return ingest.bulk_create_species(
+                list(species.values()), user=self.request.user,
+                change_reason=change_reason)
+
+    def _bulk_response(self, species, errors, status_code):
+        return Response(
+            {'created': serializers.SpeciesSerializer(
+                species, many=True).data,
+             'errors': [{'row': i, 'errors': errors[i]}
+                        for i in sorted(errors)]},
+            status=status_code)
+
+    def _get_bulk_rows(self, request):
+        """Return the species rows of a bulk creation request, and an
+        error response if there are none or too many."""
+        upload = request.FILES.get('file')
+        if upload and upload.name.lower().endswith('.csv'):
+            rows = ingest.read_species_csv(upload)
+        elif upload and upload.name.lower().endswith('.sdf'):
+            rows = ingest.read_species_sdf(upload)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return None, Response(
+                {'error': _('Provide a list of species or a .csv or .sdf '
+                            'file')}, status=status.HTTP_400_BAD_REQUEST)
+        if not rows or len(rows) > settings.SPECIES_BULK_MAX_ROWS:
+            return None, Response(
+                {'error': _('Provide 1 to '
+                            f'{settings.SPECIES_BULK_MAX_ROWS} species')},
+                status=status.HTTP_400_BAD_REQUEST)
+        return rows, None
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("smiles", OpenApiTypes.STR, required=True,
+                             description="SMILES of the molecule to find "
+                             "similar species of"),
+            OpenApiParameter("threshold", OpenApiTypes.FLOAT,
+                             description="Minimum similarity, from 0 to 1 "
+                             "(default 0.5)"),
+            OpenApiParameter("top_k", OpenApiTypes.INT,
+                             description="Maximum number of species "
+                             "(default 10)"),
+            OpenApiParameter("metric", OpenApiTypes.STR,
+                             enum=list(queries.SIMILARITY_METRICS),
+                             description="Fingerprint similarity metric "
+                             "(default tanimoto)")
+        ]
+    )
+    @action(methods=['GET'], detail=False, url_path='similar')
+    def similar(self, request):
+        """Find the species most similar to a molecule by the Tanimoto or
+        Dice similarity of their Morgan fingerprints, most similar
+        first."""
+        smiles = request.query_params.get('smiles')
+        if not smiles:
+            return Response({'error': _('No smiles provided')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rdkit_mol_obj = chem_cache.mol_from_smiles(smiles)
+        if rdkit_mol_obj is None:
+            return Response({'error': _('Invalid smiles')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        metric = request.query_params.get('metric', 'tanimoto')
+        if metric not in queries.SIMILARITY_METRICS:
+            return Response({'error': _('metric must be tanimoto or dice')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            threshold = float(request.query_params.get('threshold', 0.5))
+            top_k = int(request.query_params.get('top_k', 10))
+        except ValueError:
+            return Response({'error':
+                             _('threshold and top_k must be numbers')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= threshold <= 1 or \
+                not 1 <= top_k <= settings.SPECIES_SIMILAR_MAX_TOP_K:
+            return Response({'error':
+                             _('threshold must be between 0 and 1 and '
+                               'top_k between 1 and '
+                               f'{settings.SPECIES_SIMILAR_MAX_TOP_K}')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        results = queries.similar_species(
+            chem.morgan_fp(rdkit_mol_obj), threshold, top_k, metric)
+        data = []
+        for species, similarity in results:
+            representation = self.get_serializer(species).data
+            representation['similarity'] = similarity
+            data.append(representation)
+        return Response(data, status=status.HTTP_200_OK)
 
     @extend_schema(
         parameters=[
@@ -244,11 +513,12 @@ is being referenced through protected foreign key"
             return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
 
 
-class SpeciesMetadataViewSet(viewsets.ModelViewSet):
+class SpeciesMetadataViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for species metadata APIs."""
     serializer_class = serializers.SpeciesMetadataSerializer
     queryset = SpeciesMetadata.objects.all()
     authentication_classes = [TokenAuthentication]
+    cache_models = [SpeciesMetadata]
 
     def get_permissions(self):
         """No authentication required for GET requests."""
@@ -349,11 +619,12 @@ class SpeciesMetadataViewSet(viewsets.ModelViewSet):
             return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MetaReferenceViewSet(viewsets.ModelViewSet):
+class MetaReferenceViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for meta reference APIs."""
     serializer_class = serializers.MetaReferenceSerializer
     queryset = MetaReference.objects.all()
     authentication_classes = [TokenAuthentication]
+    cache_models = [MetaReference]
 
     def get_permissions(self):
         """No authentication required for GET requests."""
@@ -391,15 +662,18 @@ class MetaReferenceViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class LineViewSet(viewsets.ModelViewSet):
+class LineViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """View for line APIs."""
     queryset = Line.objects.all()
     serializer_class = serializers.LineSerializer
     authentication_classes = [TokenAuthentication]
+    cache_models = [Line, SpeciesMetadata, Species, Linelist]
 
     def get_permissions(self):
-        """No authentication required for GET requests."""
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
+        """No authentication required for GET requests
+        and batch line queries."""
+        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE'] \
+                and self.action != 'query_windows':
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = []
@@ -408,14 +682,28 @@ class LineViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Retrieve line."""
         if self.action == 'query':
-            return self.queryset.order_by('frequency').\
-                select_related("meta", "meta__species", "meta__linelist")
+            return serializers.QueryValuesSerializer.project(
+                self.queryset.alias_frequency_float().order_by(
+                    'frequency_float', 'id'))
         return self.queryset.order_by('-id')
 
+    def get_cache_meta_ids(self, request):
+        """Line queries limited to some species metadata use the
+        versions of their lines."""
+        if self.action_map.get('get') != 'query' or \
+                not request.GET.get('meta'):
+            return None
+        try:
+            return self._get_id_list(request.GET['meta'])
+        except ValueError:
+            return None
+
     def get_serializer_class(self):
         """Return the serializer class for request."""
         if self.action == 'query':
-            return serializers.QuerySerializer
+            return serializers.QueryValuesSerializer
+        elif self.action == 'query_windows':
+            return serializers.QueryWindowsSerializer
         elif self.action in ['update', 'partial_update']:
             return serializers.LineChangeSerializerList
         return self.serializer_class
@@ -485,11 +773,10 @@ class LineViewSet(viewsets.ModelViewSet):
             }
             return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
         meta_obj = SpeciesMetadata.objects.get(id=meta_id)
-        qpart_file = None
         # Check if the corresponding species metadata has a qpart file.
-        try:
-            qpart_file = meta_obj.qpart_file.open('r')
-        except FileNotFoundError:
+        # Its partition function comes from the values stored with the
+        # metadata, without reading the file.
+        if not meta_obj.qpart_file:
             response_msg = {
                 "code": "server_error",
                 "message": _("Internal server error."),
@@ -499,107 +786,155 @@ class LineViewSet(viewsets.ModelViewSet):
                           "Please upload the qpart file."},
             }
             return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
+        partition_function = get_partition_function(meta_obj)
         # Extract info from the .cat file.
+        contains_rovibrational = \
+            serializer.validated_data['contains_rovibrational']
+        ingest_method = serializer.validated_data['ingest_method']
+        # One change reason is shared by the history rows of every line
+        # of the upload.
+        change_reason = serializer.validated_data.get(
+            '_change_reason', f'Upload of {cat_file.name}')
+        chunk_size = serializer.validated_data.get(
+            'chunk_size', settings.LINE_UPLOAD_CHUNK_SIZE)
+        if chunk_size:
+            return self._create_chunked(
+                cat_file, qn_label_list, partition_function, chunk_size,
+                ingest_method, change_reason, meta_id, measured,
+                contains_rovibrational, vib_qn, notes)
         try:
-            frequency, uncertainty, intensity, s_ij_mu2, a_ij, \
-                lower_state_energy, upper_state_energy, \
-                lower_state_degeneracy, upper_state_degeneracy, \
-                pickett_qn_code, pickett_lower_state_qn, \
-                pickett_upper_state_qn, lower_state_qn_dict_list, \
-                upper_state_qn_dict_list = parse_cat(
-                    cat_file, qn_label_list=qn_label_list,
-                    qpart_file=qpart_file)
+            parsed_cat = parse_cat(
+                cat_file, qn_label_list=qn_label_list,
+                partition_function=partition_function,
+                qn_json=ingest_method == 'copy')
         except ValueError:
-            response_msg = {
-                "code": "server_error",
-                "message": _("Internal server error."),
-                "error": {"type": "ValueError", "message":
-                          "Quantum number labels do not match "
-                          "the number of quantum numbers in .cat file. "
-                          "Please check the labels and try again."},
-            }
-            return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
-        input_dict_list = []
-        if eval(contains_rovibrational.capitalize()):
-            """Check if the .cat file contains rovibrational lines,
-            If so, determines which particular line contains
-            rovibrational transition."""
-            for i in range(len(frequency)):
-                input_dict_list.append({'meta': meta_id,
-                                        'measured': measured,
-                                        'frequency':
-                                        format(frequency[i], '.4f'),
-                                        'uncertainty':
-                                        format(uncertainty[i], '.4f'),
-                                        'intensity':
-                                        format(intensity[i], '.4f'),
-                                        's_ij': None,
-                                        's_ij_mu2': s_ij_mu2[i],
-                                        'a_ij': a_ij[i],
-                                        'lower_state_energy':
-                                        lower_state_energy[i],
-                                        'upper_state_energy':
-                                        upper_state_energy[i],
-                                        'lower_state_degeneracy':
-                                        lower_state_degeneracy[i],
-                                        'upper_state_degeneracy':
-                                        upper_state_degeneracy[i],
-                                        'lower_state_qn':
-                                        lower_state_qn_dict_list[i],
-                                        'upper_state_qn':
-                                        upper_state_qn_dict_list[i],
-                                        'rovibrational':
-                                        not
-                                        lower_state_qn_dict_list[i][vib_qn]
-                                        ==
-                                        upper_state_qn_dict_list[i][vib_qn],
-                                        'vib_qn': vib_qn,
-                                        'pickett_qn_code':
-                                        pickett_qn_code[i],
-                                        'pickett_lower_state_qn':
-                                        pickett_lower_state_qn[i],
-                                        'pickett_upper_state_qn':
-                                        pickett_upper_state_qn[i],
-                                        'notes': notes})
-        else:
-            for i in range(len(frequency)):
-                input_dict_list.append({'meta': meta_id,
-                                        'measured': measured,
-                                        'frequency':
-                                        format(frequency[i], '.4f'),
-                                        'uncertainty':
-                                        format(uncertainty[i], '.4f'),
-                                        'intensity':
-                                        format(intensity[i], '.4f'),
-                                        's_ij': None,
-                                        's_ij_mu2': s_ij_mu2[i],
-                                        'a_ij': a_ij[i],
-                                        'lower_state_energy':
-                                        lower_state_energy[i],
-                                        'upper_state_energy':
-                                        upper_state_energy[i],
-                                        'lower_state_degeneracy':
-                                        lower_state_degeneracy[i],
-                                        'upper_state_degeneracy':
-                                        upper_state_degeneracy[i],
-                                        'lower_state_qn':
-                                        lower_state_qn_dict_list[i],
-                                        'upper_state_qn':
-                                        upper_state_qn_dict_list[i],
-                                        'rovibrational': False,
-                                        'vib_qn': vib_qn,
-                                        'pickett_qn_code': pickett_qn_code[i],
-                                        'pickett_lower_state_qn':
-                                        pickett_lower_state_qn[i],
-                                        'pickett_upper_state_qn':
-                                        pickett_upper_state_qn[i],
-                                        'notes': notes})
+            return self._qn_label_mismatch_response()
+        saved, error_response = self._save_lines(
+            parsed_cat, ingest_method, change_reason, meta_id, measured,
+            contains_rovibrational, vib_qn, notes)
+        if error_response:
+            return error_response
+        if ingest_method == 'copy':
+            # COPY does not return the saved rows, only their count.
+            return Response({'meta': int(meta_id), 'count': saved},
+                            status=status.HTTP_200_OK)
+        return Response(saved.data, status=status.HTTP_200_OK)
+
+    def _create_chunked(self, cat_file, qn_label_list, partition_function,
+                        chunk_size, ingest_method, change_reason, meta_id,
+                        measured, contains_rovibrational, vib_qn, notes):
+        """Create lines from a .cat file parsed and saved chunk_size
+        lines at a time, all in one transaction."""
+        count = 0
+        try:
+            with transaction.atomic():
+                for parsed_cat in iter_parse_cat(
+                        cat_file, qn_label_list, chunk_size,
+                        partition_function=partition_function,
+                        qn_json=ingest_method == 'copy'):
+                    _, error_response = self._save_lines(
+                        parsed_cat, ingest_method, change_reason, meta_id,
+                        measured, contains_rovibrational, vib_qn, notes)
+                    if error_response:
+                        transaction.set_rollback(True)
+                        return error_response
+                    count += len(parsed_cat.frequency)
+        except ValueError:
+            return self._qn_label_mismatch_response()
+        return Response({'meta': int(meta_id), 'count': count},
+                        status=status.HTTP_200_OK)
+
+    def _save_lines(self, parsed_cat, ingest_method, change_reason,
+                    meta_id, measured, contains_rovibrational, vib_qn,
+                    notes):
+        """Save the lines of a parsed .cat file with the requested
+        ingest method. The bulk and copy methods write the history
+        rows in bulk too, with change_reason. Returns a serializer of
+        the saved lines (their count for 'copy'), or an error response
+        if they could not be saved."""
+        if ingest_method in ['bulk', 'copy']:
+            # Lines computed from a validated .cat file skip the
+            # per-row serializer validation.
+            if not ingest.is_finite(parsed_cat):
+                return None, self._non_finite_response()
+        if ingest_method == 'copy':
+            return ingest.copy_lines(
+                parsed_cat, int(meta_id), measured, contains_rovibrational,
+                vib_qn, notes, user=self.request.user,
+                change_reason=change_reason), None
+        if ingest_method == 'bulk':
+            with transaction.atomic():
+                lines = ingest.bulk_create_lines(
+                    parsed_cat, int(meta_id), measured,
+                    contains_rovibrational, vib_qn, notes,
+                    user=self.request.user, change_reason=change_reason)
+            return serializers.LineSerializerList(lines, many=True), None
         serializer = serializers.LineSerializerList(
-            data=input_dict_list, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            data=self._get_line_dicts(
+                parsed_cat, meta_id, measured, contains_rovibrational,
+                vib_qn, notes), many=True)
+        if not serializer.is_valid():
+            return None, Response(serializer.errors,
+                                  status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return serializer, None
+
+    def _non_finite_response(self):
+        """Error response for .cat files giving non-finite values."""
+        response_msg = {
+            "code": "server_error",
+            "message": _("Internal server error."),
+            "error": {"type": "ValidationError", "message":
+                      "The .cat file gives values that are not "
+                      "finite numbers."},
+        }
+        return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
+
+    def _qn_label_mismatch_response(self):
+        """Error response for .cat files not matching the QN labels."""
+        response_msg = {
+            "code": "server_error",
+            "message": _("Internal server error."),
+            "error": {"type": "ValueError", "message":
+                      "Quantum number labels do not match "
+                      "the number of quantum numbers in .cat file. "
+                      "Please check the labels and try again."},
+        }
+        return Response(response_msg, status=status.HTTP_400_BAD_REQUEST)
+
+    def _get_line_dicts(self, parsed_cat, meta_id, measured,
+                        contains_rovibrational, vib_qn, notes):
+        """Build the LineSerializerList input for every line of a
+        parsed .cat file."""
+        input_dict_list = []
+        for i in range(len(parsed_cat.frequency)):
+            lower_state_qn = parsed_cat.lower_state_qn_dict_list[i]
+            upper_state_qn = parsed_cat.upper_state_qn_dict_list[i]
+            input_dict_list.append({
+                'meta': meta_id,
+                'measured': measured,
+                'frequency': format(parsed_cat.frequency[i], '.4f'),
+                'uncertainty': format(parsed_cat.freq_err[i], '.4f'),
+                'intensity': format(parsed_cat.logint[i], '.4f'),
+                's_ij': None,
+                's_ij_mu2': parsed_cat.sijmu[i],
+                'a_ij': parsed_cat.aij[i],
+                'lower_state_energy': parsed_cat.elow[i],
+                'upper_state_energy': parsed_cat.eup[i],
+                'lower_state_degeneracy': parsed_cat.glow[i],
+                'upper_state_degeneracy': parsed_cat.gup[i],
+                'lower_state_qn': lower_state_qn,
+                'upper_state_qn': upper_state_qn,
+                # determines which particular line contains
+                # rovibrational transition.
+                'rovibrational': contains_rovibrational and
+                lower_state_qn[vib_qn] != upper_state_qn[vib_qn],
+                'vib_qn': vib_qn,
+                'pickett_qn_code': parsed_cat.qnformat[i],
+                'pickett_lower_state_qn': parsed_cat.qnlow_str[i],
+                'pickett_upper_state_qn': parsed_cat.qnup_str[i],
+                'notes': notes})
+        return input_dict_list
 
     @extend_schema(
         parameters=[
@@ -608,7 +943,34 @@ class LineViewSet(viewsets.ModelViewSet):
                              "frequency greater than or equal to this value"),
             OpenApiParameter("max_freq", OpenApiTypes.STR,
                              description="Filter lines with frequency "
-                             "less than or equal to this value")
+                             "less than or equal to this value"),
+            OpenApiParameter("page_size", OpenApiTypes.INT,
+                             description="Return pages of this many lines "
+                             "ordered by frequency, with a next token"),
+            OpenApiParameter("cursor", OpenApiTypes.STR,
+                             description="The next token of the "
+                             "previous page"),
+            OpenApiParameter("stream", OpenApiTypes.BOOL,
+                             description="Stream all lines as "
+                             "newline-delimited JSON"),
+            OpenApiParameter("temperature", OpenApiTypes.FLOAT,
+                             description="Add the intensity of every line "
+                             "at this temperature [K] as scaled_intensity"),
+            OpenApiParameter("min_intensity", OpenApiTypes.FLOAT,
+                             description="Filter lines with intensity "
+                             "greater than or equal to this value"),
+            OpenApiParameter("top_n_per_species", OpenApiTypes.INT,
+                             description="Keep only this many of the most "
+                             "intense lines of every species"),
+            OpenApiParameter("species", OpenApiTypes.STR,
+                             description="Comma-separated species ids "
+                             "to filter lines by"),
+            OpenApiParameter("linelist", OpenApiTypes.STR,
+                             description="Comma-separated linelist ids "
+                             "to filter lines by"),
+            OpenApiParameter("meta", OpenApiTypes.STR,
+                             description="Comma-separated species "
+                             "metadata ids to filter lines by")
         ]
     )
     @action(methods=['GET'], detail=False, url_path='query')
@@ -616,24 +978,188 @@ class LineViewSet(viewsets.ModelViewSet):
         """Query lines by frequency range."""
         min_freq = request.query_params.get('min_freq')
         max_freq = request.query_params.get('max_freq')
-        queryset = self.get_queryset()
-        if min_freq and max_freq:
-            queryset = queryset.filter(
-                frequency__gte=min_freq, frequency__lte=max_freq)
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        elif min_freq:
-            queryset = queryset.filter(frequency__gte=min_freq)
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        elif max_freq:
-            queryset = queryset.filter(frequency__lte=max_freq)
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
+        if not min_freq and not max_freq:
             return Response({'error':
                              _('No min_freq and/or max_freq provided')},
                             status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_freq = float(min_freq) if min_freq else None
+            max_freq = float(max_freq) if max_freq else None
+        except ValueError:
+            return Response({'error':
+                             _('min_freq and max_freq must be numbers')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        temperature = request.query_params.get('temperature')
+        if temperature is not None:
+            try:
+                temperature = float(temperature)
+            except ValueError:
+                temperature = None
+            if temperature is None or not 0 < temperature < float('inf'):
+                return Response({'error':
+                                 _('temperature must be a positive number')},
+                                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_intensity = request.query_params.get('min_intensity')
+            min_intensity = float(min_intensity) if min_intensity else None
+            if min_intensity is not None and \
+                    not math.isfinite(min_intensity):
+                raise ValueError
+        except ValueError:
+            return Response({'error': _('min_intensity must be a number')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_n = request.query_params.get('top_n_per_species')
+            top_n = int(top_n) if top_n else None
+            id_filters = {
+                param: self._get_id_list(request.query_params[param])
+                for param in ['species', 'linelist', 'meta']
+                if request.query_params.get(param)}
+        except ValueError:
+            return Response({'error':
+                             _('top_n_per_species, species, linelist and '
+                               'meta must be integers')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if top_n is not None and top_n < 1:
+            return Response({'error':
+                             _('top_n_per_species must be at least 1')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Range filters go through the float8 cast of frequency that
+        # the frequency index covers.
+        queryset = self.get_queryset()
+        if min_freq is not None:
+            queryset = queryset.filter(frequency_float__gte=min_freq)
+        if max_freq is not None:
+            queryset = queryset.filter(frequency_float__lte=max_freq)
+        if min_intensity is not None:
+            queryset = queryset.filter(intensity__gte=min_intensity)
+        # Species and linelists are resolved to their metadata ids, so
+        # that every id filter is a meta_id filter the (meta, frequency)
+        # index covers.
+        if 'meta' in id_filters:
+            queryset = queryset.filter(meta_id__in=id_filters['meta'])
+        if 'species' in id_filters:
+            queryset = queryset.filter(meta__in=SpeciesMetadata.objects.filter(
+                species_id__in=id_filters['species']).values('id'))
+        if 'linelist' in id_filters:
+            queryset = queryset.filter(meta__in=SpeciesMetadata.objects.filter(
+                linelist_id__in=id_filters['linelist']).values('id'))
+        if top_n is not None:
+            queryset = queryset.top_n_per_species(top_n)
+        if request.query_params.get('stream', '').lower() == 'true':
+            return self._stream_query(queryset, temperature)
+        paginator = FrequencyKeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(
+                self._represent_lines(page, temperature))
+        return Response(self._represent_lines(list(queryset), temperature),
+                        status=status.HTTP_200_OK)
+
+    def _represent_lines(self, rows, temperature=None):
+        """Serialize queried lines, adding their intensities at
+        temperature as scaled_intensity when it is given."""
+        data = self.get_serializer(rows, many=True).data
+        if temperature is None:
+            return data
+        for representation, value in zip(
+                data, intensity.scaled_intensities(rows, temperature)):
+            representation['scaled_intensity'] = \
+                None if value is None else format(value, '.4f')
+        return data
+
+    def _get_id_list(self, id_str):
+        """Convert a comma-separated string of ids to integers."""
+        return [int(id_) for id_ in id_str.split(',')]
+
+    def _stream_query(self, queryset, temperature=None):
+        """Stream queried lines as newline-delimited JSON, fetching
+        them from a server-side cursor so that memory use does not grow
+        with the frequency range. Scaled intensities are computed one
+        fetched chunk of lines at a time."""
+        encoder = JSONEncoder()
+        chunk_size = settings.LINE_QUERY_STREAM_CHUNK_SIZE
+
+        def lines():
+            rows = queryset.iterator(chunk_size=chunk_size)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                for representation in self._represent_lines(
+                        chunk, temperature):
+                    yield encoder.encode(representation) + '\n'
+
+        return StreamingHttpResponse(
+            lines(), content_type='application/x-ndjson')
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("linelist", OpenApiTypes.STR,
+                             description="Comma-separated linelist ids "
+                             "to export the lines of"),
+            OpenApiParameter("meta", OpenApiTypes.STR,
+                             description="Comma-separated species "
+                             "metadata ids to export the lines of"),
+            OpenApiParameter("file_format", OpenApiTypes.STR,
+                             enum=export.FORMATS,
+                             description="arrow (Arrow IPC), parquet or "
+                             "npz (compressed NumPy); defaults to arrow if "
+                             "pyarrow is installed, npz otherwise")
+        ]
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Export the lines of linelists or species metadata as a
+        columnar binary file."""
+        linelist = request.query_params.get('linelist')
+        meta = request.query_params.get('meta')
+        if not linelist and not meta:
+            return Response({'error': _('No linelist or meta provided')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            meta_ids = self._get_id_list(meta) if meta else []
+            if linelist:
+                meta_ids += SpeciesMetadata.objects.filter(
+                    linelist_id__in=self._get_id_list(linelist)).values_list(
+                        'id', flat=True)
+        except ValueError:
+            return Response({'error':
+                             _('linelist and meta must be integers')},
+                            status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.query_params.get(
+            'file_format', export.default_format())
+        export_file = tempfile.TemporaryFile()
+        try:
+            export.export_lines(meta_ids, export_file, file_format)
+        except ValueError as exception:
+            export_file.close()
+            return Response({'error': str(exception)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        export_file.seek(0)
+        return FileResponse(export_file, as_attachment=True,
+                            filename=f'lines.{file_format}',
+                            content_type=export.CONTENT_TYPES[file_format])
+
+    @action(methods=['POST'], detail=False, url_path='query-windows')
+    def query_windows(self, request):
+        """Query lines in many frequency windows at once, returning the
+        lines of every window in the order of the windows."""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+        windows = serializer.validated_data['windows']
+        results = queries.query_windows(
+            [(window['min_freq'], window['max_freq']) for window in windows])
+        line_serializer = serializers.QueryValuesSerializer()
+        return Response([
+            {'min_freq': window['min_freq'],
+             'max_freq': window['max_freq'],
+             'lines': [line_serializer.to_representation(row)
+                       for row in rows]}
+            for window, rows in zip(windows, results)],
+            status=status.HTTP_200_OK)
 
     @extend_schema(
         parameters=[
@@ -651,3 +1177,15 @@ class LineViewSet(viewsets.ModelViewSet):
         instance._change_reason = self.request.query_params['delete_reason']
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ChemCacheStatsView(APIView):
+    """View for the hit and miss counters of the caches of molecules and
+    fields derived from SMILES, in the process serving the request."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    def get(self, request):
+        """Return the statistics of every cache."""
+        return Response(chem_cache.cache_info(), status=status.HTTP_200_OK)